@@ -1,16 +1,19 @@
 from apispec import APISpec
 from apispec.ext.marshmallow import MarshmallowPlugin
-from flask import Flask, jsonify
+from flask import abort, Flask, jsonify, request
 from flask_migrate import Migrate
 from jose.exceptions import JWTError
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
 
 from auth0 import AuthError
+import db_pool
 import env
 import loggers
+import metrics
+import query_stats
 from models import db, docs, marshmallow
-from . import user, login
+from . import export, user, login, maintenance, query_plans
 from .auth import login_manager
 from .swaggerui import API_URL, SWAGGER_URL, swaggerui_blueprint
 import wait_for_db
@@ -61,10 +64,12 @@ def create_app():
 
     app = Flask(__name__)
     loggers.init_app(app)
+    query_stats.init_app(app)
     app.config.update(
         {
             "SQLALCHEMY_DATABASE_URI": env.PGDB_CONNECTION_STRING,
             "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            "SQLALCHEMY_ENGINE_OPTIONS": db_pool.engine_options(),
             "APISPEC_SPEC": spec,
             "APISPEC_SWAGGER_UI_URL": None,
             "APISPEC_SWAGGER_URL": API_URL,
@@ -74,9 +79,13 @@ def create_app():
     marshmallow.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    maintenance.init_app(app)
+    query_plans.init_app(app)
+    export.init_app(app)
 
     app.register_blueprint(user.blueprint, url_prefix=prefix)
     app.register_blueprint(login.blueprint, url_prefix=prefix)
+    app.register_blueprint(export.blueprint, url_prefix=prefix)
     # app.register_blueprint(power.blueprint, url_prefix=prefix)
     # app.register_blueprint(feed.blueprint, url_prefix=prefix)
     # app.register_blueprint(car.blueprint, url_prefix=prefix)
@@ -105,6 +114,13 @@ def create_app():
     def version():
         return jsonify(version=env.VERSION, api_version=current_version)
 
+    @app.route("/metrics")
+    def process_metrics():
+        if not metrics.authorized(request):
+            abort(403)
+
+        return jsonify(metrics.snapshot())
+
     docs.init_app(app)
 
     @app.errorhandler(AuthError)
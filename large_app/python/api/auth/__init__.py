@@ -1,28 +1,54 @@
 from flask import current_app, Response
 from flask_login import LoginManager
 
+import metrics
 from models import User
 from . import basic_auth
 from . import token_auth
 
 login_manager = LoginManager()
 
+# Authorization header scheme (lower case) -> function taking the request and
+# returning an auth result with a `user`, or None
+authenticators = {
+    "basic": basic_auth.request_to_auth_result,
+    "bearer": token_auth.request_to_auth_result,
+}
+auth_timings = metrics.Timings()
+_AUTH_RESULT = "app.auth_result"
+metrics.register("auth", auth_timings.stats)
+
+
+def authenticate(req):
+    """Run the one authenticator matching the Authorization scheme of req.
+    The result is kept in the request's WSGI environ, so authenticating
+    again in the same request (e.g. Flask-Login and a view) is free. Not on
+    `g`, which is shared by requests run inside one app context"""
+
+    if _AUTH_RESULT in req.environ:
+        return req.environ[_AUTH_RESULT]
+
+    scheme = req.headers.get("authorization", "").split(" ", 1)[0].lower()
+    authenticator = authenticators.get(scheme)
+    auth_result = None
+
+    if authenticator:
+        with auth_timings[scheme].time():
+            auth_result = authenticator(req)
+    req.environ[_AUTH_RESULT] = auth_result
+
+    return auth_result
+
 
 @login_manager.request_loader
 def load_user_from_auth_header(req) -> User:
-    """Try via both http basic check and token auth to get a user object from
-    our database to match an authorized user"""
-
-    methods = [
-        basic_auth.user_from_basic_auth_request,
-        token_auth.user_from_access_token,
-    ]
+    """Get a user object from our database matching the authorized user,
+    using the authenticator for the request's Authorization scheme"""
 
-    for method in methods:
-        user = method(req)
+    auth_result = authenticate(req)
 
-        if user:
-            return user
+    if auth_result:
+        return auth_result.user
 
     # Failed to get decent login
 
@@ -1,8 +1,21 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
+from datetime import timedelta
 import logging
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm.attributes import set_committed_value
 
 import auth0
+from cache import SingleFlight, TTLCache
+import env
+import metrics
 from models import Auth0Mapping, BasicCache, db, User
+from models.user import credential_digest, user_info_fingerprint
+from .identity import invalidate_user
 
 log = logging.getLogger(__name__)
 
@@ -69,11 +82,135 @@ def _token_result(username, password) -> auth0.TokenResult:
     token_result = BasicCache.verify(username, password)
 
     if not token_result:
-        token_result = fetch_and_cache_auth0_token(username, password)
+        try:
+            # Parallel requests with the same credentials share one password
+            # grant
+            token_result = _password_grants.do(
+                credential_digest(username, password),
+                lambda: _fetch_once(username, password),
+            )
+        except Exception as ex:
+            token_result = _stale_token_result(username, password, ex)
+
+            if token_result:
+                return token_result
+
+            if isinstance(ex, auth0.AuthError) or not auth0.is_unavailable(ex):
+                raise
+            raise auth0.AuthError(
+                {
+                    "code": "auth0_unavailable",
+                    "description": "Login is temporarily unavailable",
+                },
+                503,
+            ) from ex
+
+    return token_result
+
+
+def _stale_token_result(username, password, ex) -> auth0.TokenResult:
+    """While Auth0 is unavailable, fall back to a recently expired cache
+    entry for these exact credentials and retry the grant in the background
+    """
+
+    if not env.BASIC_CACHE_STALE_GRACE or not auth0.is_unavailable(ex):
+        return None
+
+    token_result = BasicCache.verify(
+        username,
+        password,
+        max_stale=timedelta(seconds=env.BASIC_CACHE_STALE_GRACE),
+    )
+
+    if token_result:
+        log.warning(
+            "Auth0 unavailable (%r). Serving expired token for %s",
+            ex,
+            username,
+        )
+        _stale_stats.incr("served")
+        _refresh_in_background(username, password)
 
     return token_result
 
 
+def _refresh_in_background(username, password) -> None:
+    key = credential_digest(username, password)
+
+    if _stale_refreshes.get(key):
+        return
+    _stale_refreshes.set(key, True)
+    app = current_app._get_current_object()
+
+    def refresh():
+        with app.app_context():
+            try:
+                _password_grants.do(
+                    key, lambda: _fetch_once(username, password)
+                )
+            except Exception:
+                log.info("Background refresh for %s failed", username)
+
+    threading.Thread(
+        target=refresh, name="basic-auth-refresh", daemon=True
+    ).start()
+
+
+def _fetch_once(username, password) -> auth0.TokenResult:
+    if not env.BASIC_AUTH_ADVISORY_LOCK:
+        return fetch_and_cache_auth0_token(username, password)
+
+    # The lock, and the re-check under it, have to be on the primary
+    db.use_primary()
+    deadline = time.monotonic() + env.BASIC_AUTH_ADVISORY_LOCK_WAIT
+
+    # Workers in other processes wait (without holding a connection) while
+    # one of them does the grant, and then find its result in basic_cache.
+    # Past the deadline a worker stops waiting and does its own grant.
+    while True:
+        with _advisory_lock(f"basic_cache:{username}") as locked:
+            if locked or time.monotonic() >= deadline:
+                with db:
+                    token_result = BasicCache.verify(username, password)
+
+                return token_result or fetch_and_cache_auth0_token(
+                    username, password
+                )
+        time.sleep(_ADVISORY_LOCK_POLL_INTERVAL)
+
+
+@contextmanager
+def _advisory_lock(name):
+    """Try to take a session level advisory lock on a connection of its own
+    in autocommit mode, so no transaction is open while it is held. Yields
+    whether the lock was taken"""
+    key = func.hashtext(name)
+
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        locked = connection.scalar(select([func.pg_try_advisory_lock(key)]))
+        try:
+            yield locked
+        finally:
+            if locked:
+                connection.scalar(select([func.pg_advisory_unlock(key)]))
+
+
+_ADVISORY_LOCK_POLL_INTERVAL = 0.05
+_password_grants = SingleFlight()
+_stale_refreshes = TTLCache(
+    maxsize=10000, ttl=env.BASIC_CACHE_STALE_RETRY_INTERVAL
+)
+_stale_stats = metrics.Counters("served")
+metrics.register(
+    "basic_auth_grants",
+    lambda: {
+        "coalesced": _password_grants.coalesced,
+        "stale_served": _stale_stats["served"],
+    },
+)
+
+
 def _find_any_exiting_mapping_and_refresh_user(token_result) -> Auth0Mapping:
     # 2) find the mapping between auth0 user and "our user" (in db)
     mapping = Auth0Mapping.get_from_sub(token_result.subject)
@@ -88,7 +225,13 @@ def _find_any_exiting_mapping_and_refresh_user(token_result) -> Auth0Mapping:
 
 def _create_user_from_auth0(token_result):
     # 3) If the mapping wasn't found but auth0 knows the user,
-    # create the mapping
+    # create the mapping. Look again on the primary first: a replica may not
+    # have the mapping another request just created yet
+    db.use_primary()
+    mapping = _find_any_exiting_mapping_and_refresh_user(token_result)
+
+    if mapping:
+        return mapping.user
 
     with db as session:
         user, update = User.from_auth0(
@@ -105,29 +248,56 @@ def _create_user_from_auth0(token_result):
 
 def fetch_and_cache_auth0_token(username, password) -> auth0.TokenResult:
     token_result = auth0.token_from_username_password(username, password)
-    with db as session:
-        pruned = False
-
-        for p in BasicCache.prunable():
-            log.info("Pruned %s %s %s", p, p.expired, p.expires)
-            session.delete(p)
-            pruned = True
-
-        if pruned:
-            session.commit()
-        cur = BasicCache.query.get(username)
-
-        if cur:
-            log.info("Forcefully expired %s", cur)
-            session.delete(cur)
-        session.add(BasicCache.create(username, password, token_result))
-        session.commit()
+    BasicCache.store(username, password, token_result)
 
     return token_result
 
 
 def update_user_from_token(mapping, id_token) -> None:
-    with db as session:
-        mapping.user.update_from_auth0(id_token)
-        session.commit()
-        session.refresh(mapping.user)
+    """Apply the id_token's user info to the mapped user with at most one
+    UPDATE. Skipped entirely when this worker already applied the same info
+    for the user recently"""
+    user = mapping.user
+    fingerprint = user_info_fingerprint(id_token)
+
+    if _applied_user_info.get(user.id) == fingerprint:
+        _refresh_stats.incr("skipped")
+
+        return
+
+    changes = user.changes_from_auth0(id_token)
+
+    if changes:
+        table = User.__table__
+        # Read the rest of the request back from where we wrote
+        db.use_primary()
+
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                table.update()
+                .where(table.c.id == user.id)
+                .values(changes)
+                .returning(table.c.updated)
+            ).scalar()
+        changes["updated"] = updated
+
+        # Keep the loaded user current without a refresh. Mapper events
+        # don't fire for core updates, so invalidate the identity cache too
+        for k, value in changes.items():
+            set_committed_value(user, k, value)
+        invalidate_user(user.id)
+        _refresh_stats.incr("updated")
+    _applied_user_info.set(user.id, fingerprint)
+
+
+@event.listens_for(User, "after_update")
+def _forget_applied_user_info(mapper, connection, user):
+    _applied_user_info.pop(user.id)
+
+
+_applied_user_info = TTLCache(
+    maxsize=env.BASIC_AUTH_USER_REFRESH_CACHE_SIZE,
+    ttl=env.BASIC_AUTH_USER_REFRESH_TTL,
+)
+_refresh_stats = metrics.Counters("skipped", "updated")
+metrics.register("basic_auth_user_refresh", _refresh_stats.stats)
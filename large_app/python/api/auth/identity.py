@@ -0,0 +1,96 @@
+"""Worker local cache from an Auth0 subject to a read-only snapshot of our
+user, so authenticating a bearer token doesn't have to load the User with
+all its eager loaded relationships. Entries live for IDENTITY_CACHE_TTL
+seconds and are dropped when the user is written in this process.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from cache import TTLCache
+import env
+import metrics
+from models import Auth0Mapping, db, User
+
+
+@dataclass(frozen=True, eq=False)
+class UserIdentity(UserMixin):
+    """Detached, read-only stand-in for User as Flask-Login's current_user"""
+
+    id: int
+    name: str
+    email: str
+    phone: str = None
+    locale: str = None
+    terms_accept: bool = None
+    terms_accept_at: datetime = None
+
+    @classmethod
+    def from_user(cls, user) -> "UserIdentity":
+        return cls(**{k: getattr(user, k) for k in _identity_fields})
+
+
+_identity_fields = [
+    "id",
+    "name",
+    "email",
+    "phone",
+    "locale",
+    "terms_accept",
+    "terms_accept_at",
+]
+
+
+@db.replica()
+def identity_for_sub(sub) -> UserIdentity:
+    """The cached identity for sub, loaded with a single two table query on
+    a miss. None if there is no mapping for sub"""
+    identity = _identities.get(sub)
+
+    if identity is None:
+        row = (
+            User.query.join(Auth0Mapping, Auth0Mapping.user_id == User.id)
+            .filter(Auth0Mapping.sub == sub)
+            .with_entities(*(getattr(User, k) for k in _identity_fields))
+            .one_or_none()
+        )
+
+        if row is not None:
+            identity = UserIdentity(*row)
+            _remember(sub, identity)
+
+    return identity
+
+
+def remember_user(sub, user) -> UserIdentity:
+    identity = UserIdentity.from_user(user)
+    _remember(sub, identity)
+
+    return identity
+
+
+def invalidate_user(user_id) -> None:
+    sub = _subs.pop(user_id)
+
+    if sub is not None:
+        _identities.pop(sub)
+
+
+def _remember(sub, identity):
+    _identities.set(sub, identity)
+    _subs.set(identity.id, sub)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_write(mapper, connection, user):
+    invalidate_user(user.id)
+
+
+_identities = TTLCache(
+    maxsize=env.IDENTITY_CACHE_SIZE, ttl=env.IDENTITY_CACHE_TTL
+)
+_subs = TTLCache(maxsize=env.IDENTITY_CACHE_SIZE, ttl=env.IDENTITY_CACHE_TTL)
+metrics.register("identity_cache", _identities.stats)
@@ -1,7 +1,9 @@
+from dataclasses import dataclass
 import logging
 
 import auth0
-from models import Auth0Mapping, db, User
+from models import db, User
+from .identity import identity_for_sub, remember_user, UserIdentity
 
 log = logging.getLogger(__name__)
 
@@ -17,17 +19,44 @@ def request_bearer_token(request) -> str:
     return header_token
 
 
-def user_from_access_token(request) -> User:
+@dataclass
+class TokenAuthResult:
+    user: UserIdentity
+    access_token: dict
+
+
+def user_from_access_token(request) -> UserIdentity:
+    token_auth_result = request_to_auth_result(request)
+
+    return token_auth_result.user if token_auth_result else None
+
+
+def request_to_auth_result(request) -> TokenAuthResult:
     header_token = request_bearer_token(request)
 
     if not header_token:
         return None
 
     auth_info = auth0.token_from_header_value(header_token)
-    mapping = Auth0Mapping.get_from_sub(auth_info["sub"])
 
-    if mapping:
-        return mapping.user
+    return TokenAuthResult(
+        user=_user_from_auth_info(auth_info), access_token=auth_info
+    )
+
+
+def _user_from_auth_info(auth_info) -> UserIdentity:
+    identity = identity_for_sub(auth_info["sub"])
+
+    if identity:
+        return identity
+
+    # Look again on the primary before creating the user: a replica may not
+    # have the user another request just created yet
+    db.use_primary()
+    identity = identity_for_sub(auth_info["sub"])
+
+    if identity:
+        return identity
 
     user_info = auth0.management_api.get_userinfo(auth_info["sub"])
     log.info(
@@ -43,5 +72,6 @@ def user_from_access_token(request) -> User:
             session.add(user)
         session.commit()
         session.refresh(user)
+        identity = remember_user(auth_info["sub"], user)
 
-    return user
+    return identity
@@ -0,0 +1,4 @@
+from .users import init_app
+from .views import blueprint
+
+__all__ = ["blueprint", "init_app"]
@@ -0,0 +1,151 @@
+"""Streaming exports of all users with their Auth0 sub, locations and alert
+subscriptions
+
+Rows come from a server-side cursor (or COPY for the CSV CLI export) a chunk
+at a time, so memory use doesn't depend on the number of users. Locations
+and alert subscriptions are aggregated to JSON per user by Postgres. Exports
+read from a replica when there is a usable one.
+"""
+import csv
+from datetime import date
+import io
+import json
+
+import click
+
+import env
+from models import db
+
+COLUMNS = [
+    "id",
+    "created",
+    "updated",
+    "deleted",
+    "name",
+    "email",
+    "phone",
+    "locale",
+    "terms_accept",
+    "terms_accept_at",
+    "auth0_sub",
+    "locations",
+    "alerts",
+]
+
+_SELECT_USERS = """
+SELECT u.id, u.created, u.updated, u.deleted, u.name, u.email, u.phone,
+    u.locale, u.terms_accept, u.terms_accept_at, m.sub AS auth0_sub,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'id', l.id, 'name', l.name, 'street', l.street, 'city', l.city,
+            'country', l.country, 'primary', l."primary"
+        ) ORDER BY l.id)
+        FROM user_location l WHERE l.user_id = u.id
+    ), '[]') AS locations,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'alert_type_id', a.alert_type_id, 'name', t.name,
+            'enabled', a.enabled, 'channels', a.channels
+        ) ORDER BY a.alert_type_id)
+        FROM alert_subscription a JOIN alert_type t ON t.id = a.alert_type_id
+        WHERE a.user_id = u.id
+    ), '[]') AS alerts
+FROM "user" u LEFT JOIN auth0_mapping m ON m.user_id = u.id
+"""
+
+EXPORT_SQL = _SELECT_USERS + "ORDER BY u.id\n"
+
+# Every column as Postgres renders it as text, so CSV from the cursor and
+# from COPY is the same
+CSV_SQL = (
+    "SELECT "
+    + ", ".join(f"{column}::text AS {column}" for column in COLUMNS)
+    + f" FROM ({_SELECT_USERS}) AS export ORDER BY export.id"
+)
+
+
+def export_rows(sql, chunk_rows):
+    """Lists of at most chunk_rows rows of sql, from a server-side cursor"""
+
+    with _read_engine().connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(sql)
+
+        while True:
+            rows = result.fetchmany(chunk_rows)
+
+            if not rows:
+                return
+
+            yield rows
+
+
+def ndjson_chunks(chunk_rows=env.EXPORT_CHUNK_ROWS):
+    for rows in export_rows(EXPORT_SQL, chunk_rows):
+        yield "".join(
+            json.dumps(dict(row), default=_json_default) + "\n" for row in rows
+        )
+
+
+def csv_chunks(chunk_rows=env.EXPORT_CHUNK_ROWS):
+    yield _csv_lines([COLUMNS])
+
+    for rows in export_rows(CSV_SQL, chunk_rows):
+        yield _csv_lines(rows)
+
+
+def copy_csv(out) -> None:
+    """Write the CSV export to the file out with COPY ... TO STDOUT"""
+    connection = _read_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY ({CSV_SQL}) TO STDOUT WITH (FORMAT csv, HEADER)", out
+            )
+    finally:
+        connection.close()
+
+
+formats = {
+    "ndjson": ("application/x-ndjson", ndjson_chunks),
+    "csv": ("text/csv", csv_chunks),
+}
+
+
+def _read_engine():
+    return db.replica_engine(db.session()) or db.engine
+
+
+def _csv_lines(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+
+    return buffer.getvalue()
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def init_app(app):
+    @app.cli.command("export-users")
+    @click.option(
+        "--format",
+        "fmt",
+        type=click.Choice(sorted(formats)),
+        default="ndjson",
+        show_default=True,
+    )
+    @click.option("--output", type=click.File("w"), default="-")
+    def export_users_command(fmt, output):
+        """Write all users with locations and alert subscriptions"""
+
+        if fmt == "csv":
+            copy_csv(output)
+
+            return
+
+        for chunk in ndjson_chunks():
+            output.write(chunk)
@@ -0,0 +1,55 @@
+from flask import abort, Blueprint, Response, stream_with_context
+from flask_apispec import marshal_with, MethodResource, use_kwargs
+from flask_login import current_user, login_required
+
+import env
+from models import docs
+from models.schemas import UserExportArgsSchema
+from models.user import normalize_email
+from ..spec import docer
+from .users import formats
+
+blueprint = Blueprint("export", __name__)
+
+doc = docer("export")
+
+
+class UserExportResource(MethodResource):
+    @login_required
+    @use_kwargs(UserExportArgsSchema, locations=("query",))
+    @marshal_with(None, code=200, description="NDJSON or CSV, chunked")
+    @marshal_with(None, code=403, description="Not an export admin")
+    @doc(
+        description=(
+            "Stream all users with their locations and alert subscriptions. "
+            "Only for the admins in EXPORT_ADMIN_EMAILS"
+        ),
+        stub=False,
+    )
+    def get(self, fmt):
+        if normalize_email(current_user.email) not in env.EXPORT_ADMIN_EMAILS:
+            abort(403)
+
+        mimetype, chunks = formats[fmt]
+
+        return Response(
+            stream_with_context(chunks()),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=users.{fmt}"
+            },
+        )
+
+
+blueprint.add_url_rule(
+    "/admin/users/export",
+    view_func=UserExportResource.as_view("user_export"),
+)
+
+
+docs.register(
+    UserExportResource, endpoint="user_export", blueprint=blueprint.name
+)
+
+
+__all__ = ["blueprint"]
@@ -2,7 +2,7 @@ from flask import Blueprint, request
 from flask_apispec import marshal_with, MethodResource, use_kwargs
 from models.schemas import TokenResultSchema, ForgotPassword, LoginSchema
 from models import docs
-from ..auth import basic_auth, token_auth, unauth
+from ..auth import authenticate, basic_auth, unauth
 from ..spec import docer, empty_204, not_implemented
 
 blueprint = Blueprint("login", __name__)
@@ -22,11 +22,11 @@ class LoginResource(MethodResource):
     @marshal_with(None, 204, description="When using token. Token OK")
     @doc(description="Perform login - and potentially get a token", stub=False)
     def get(self):
-        basic_auth_result = basic_auth.request_to_auth_result(request)
+        auth_result = authenticate(request)
 
-        if basic_auth_result:
-            return basic_auth_result.token_result.result
-        elif token_auth.user_from_access_token(request):
+        if isinstance(auth_result, basic_auth.BasicAuthResult):
+            return auth_result.token_result.result
+        elif auth_result:
             return empty_204()
         else:
             return unauth()
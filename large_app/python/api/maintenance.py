@@ -0,0 +1,60 @@
+"""Housekeeping jobs, run from the CLI or periodically in the background"""
+import logging
+import random
+import threading
+import time
+
+import click
+
+import env
+from models import BasicCache
+
+log = logging.getLogger(__name__)
+
+
+def prune_basic_cache(batch_size=env.BASIC_CACHE_PRUNE_BATCH_SIZE) -> int:
+    pruned = BasicCache.prune(batch_size)
+
+    if pruned:
+        log.info("Pruned %s expired basic_cache entries", pruned)
+
+    return pruned
+
+
+def start_basic_cache_pruner(app, interval) -> threading.Thread:
+    def prune_forever():
+        while True:
+            # Jitter so the workers of a pod don't all prune at once
+            time.sleep(interval * random.uniform(0.5, 1.5))
+            try:
+                with app.app_context():
+                    prune_basic_cache()
+            except Exception:
+                log.warning("Pruning basic_cache failed", exc_info=True)
+
+    thread = threading.Thread(
+        target=prune_forever, name="basic-cache-pruner", daemon=True
+    )
+    thread.start()
+
+    return thread
+
+
+def init_app(app):
+    @app.cli.command("prune-basic-cache")
+    @click.option(
+        "--batch-size",
+        default=env.BASIC_CACHE_PRUNE_BATCH_SIZE,
+        show_default=True,
+        help="Rows deleted per statement",
+    )
+    def prune_basic_cache_command(batch_size):
+        """Delete expired basic_cache entries"""
+        click.echo(f"Pruned {prune_basic_cache(batch_size)} entries")
+
+    if env.BASIC_CACHE_PRUNE_INTERVAL > 0:
+        # Started on the first request so it runs in the serving (post fork)
+        # process only, not in CLI invocations
+        @app.before_first_request
+        def start_background_jobs():
+            start_basic_cache_pruner(app, env.BASIC_CACHE_PRUNE_INTERVAL)
@@ -0,0 +1,38 @@
+"""index basic_cache.expires
+
+Revision ID: 464f09c32ffd
+Revises: 8caa59cacad3
+Create Date: 2026-10-18 09:55:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '464f09c32ffd'
+down_revision = '8caa59cacad3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY can't run inside the migration transaction, but doesn't
+    # block logins writing to basic_cache while the index builds
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_basic_cache_expires'),
+            'basic_cache',
+            ['expires'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f('ix_basic_cache_expires'),
+            table_name='basic_cache',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,49 @@
+"""index auth0_mapping.sub and the user relationship foreign keys
+
+Revision ID: b3d1f0e2c7a4
+Revises: 464f09c32ffd
+Create Date: 2026-10-18 14:02:37.915276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d1f0e2c7a4'
+down_revision = '464f09c32ffd'
+branch_labels = None
+depends_on = None
+
+# basic_cache.expires is indexed by 464f09c32ffd
+indexes = [
+    ('auth0_mapping', 'sub', True),
+    ('user_location', 'user_id', False),
+    ('alert_subscription', 'user_id', False),
+]
+
+
+def upgrade():
+    # Built CONCURRENTLY (outside the migration transaction) so logins and
+    # user writes aren't blocked while the indexes build. A failed build
+    # leaves an INVALID index behind that has to be dropped before retrying,
+    # for the unique one that means removing duplicate subs first.
+    with op.get_context().autocommit_block():
+        for table, column, unique in indexes:
+            op.create_index(
+                op.f(f'ix_{table}_{column}'),
+                table,
+                [column],
+                unique=unique,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, column, _ in reversed(indexes):
+            op.drop_index(
+                op.f(f'ix_{table}_{column}'),
+                table_name=table,
+                postgresql_concurrently=True,
+            )
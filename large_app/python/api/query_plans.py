@@ -0,0 +1,101 @@
+"""EXPLAIN checks for the queries on the authentication hot path
+
+`flask check-query-plans` plans each query below with sequential scans
+disabled and fails if any of them still scans a table, which means an
+index it relies on is missing. Table size doesn't matter for the check,
+so it can run against an empty database right after `flask db upgrade`.
+"""
+from datetime import datetime
+import json
+
+import click
+
+from models import AlertSubscription, Auth0Mapping, BasicCache, db, User
+from models.user import normalize_email, UserLocation
+
+
+def hot_queries(session) -> dict:
+    return {
+        "user_by_sub": (
+            session.query(User.id, User.email)
+            .join(Auth0Mapping, Auth0Mapping.user_id == User.id)
+            .filter(Auth0Mapping.sub == "auth0|plan-check")
+        ),
+        "user_by_id": session.query(User).filter(User.id == 1),
+        "user_by_email": session.query(User).filter(
+            User.email_normalized == normalize_email("Plan@Check")
+        ),
+        "user_locations": session.query(UserLocation).filter(
+            UserLocation.user_id == 1
+        ),
+        "alert_subscriptions": session.query(AlertSubscription).filter(
+            AlertSubscription.user_id == 1
+        ),
+        "basic_cache_by_username": session.query(BasicCache).filter(
+            BasicCache.username == "plan-check"
+        ),
+        "basic_cache_prunable": (
+            session.query(BasicCache.username)
+            .filter(BasicCache.expires <= datetime.utcnow())
+            .limit(1000)
+        ),
+    }
+
+
+def explain(session, query) -> dict:
+    """The JSON plan of query, planned with sequential scans disabled"""
+    connection = session.connection()
+    compiled = query.statement.compile(dialect=connection.dialect)
+    connection.execute("SET LOCAL enable_seqscan = off")
+    result = connection.execute(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar()
+
+    # psycopg2 decodes the json column, other drivers may not
+    plan = json.loads(result) if isinstance(result, str) else result
+
+    return plan[0]["Plan"]
+
+
+def sequential_scans(plan) -> list:
+    """Tables scanned sequentially anywhere in plan"""
+    tables = []
+
+    if plan.get("Node Type") == "Seq Scan":
+        tables.append(plan.get("Relation Name"))
+
+    for child in plan.get("Plans", []):
+        tables.extend(sequential_scans(child))
+
+    return tables
+
+
+def check_query_plans() -> dict:
+    """Map of query name to the tables it scans sequentially"""
+    failures = {}
+
+    with db as session:
+        for name, query in hot_queries(session).items():
+            tables = sequential_scans(explain(session, query))
+
+            if tables:
+                failures[name] = tables
+        session.rollback()
+
+    return failures
+
+
+def init_app(app):
+    @app.cli.command("check-query-plans")
+    def check_query_plans_command():
+        """Fail if a hot query falls back to a sequential scan"""
+        failures = check_query_plans()
+
+        for name, tables in failures.items():
+            click.echo(f"{name}: Seq Scan on {', '.join(tables)}")
+
+        if failures:
+            raise click.ClickException(
+                f"{len(failures)} queries need a missing index"
+            )
+        click.echo("All hot queries use indexes")
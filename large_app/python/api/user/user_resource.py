@@ -16,7 +16,7 @@ class UserResource(MethodResource):
     @marshal_with(UserSchema, code=200, description="A user")
     @doc(description="Get the current logged in user", stub=False)
     def get(self):
-        user = User.query.get(current_user.id)
+        user = User.with_details().populate_existing().get(current_user.id)
 
         return user
 
@@ -85,7 +85,7 @@ class UserResource(MethodResource):
         with db as session:
             session.add(user)
             session.commit()
-            session.refresh(user)
+            user = User.with_details().populate_existing().get(user.id)
 
         return user
 
@@ -1,13 +1,20 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+import hashlib
 import logging
+import os
+import threading
+import time
 from urllib.parse import urljoin
 
-from jose import jwt
 import requests
 
+from cache import SingleFlight, TTLCache
 import env
-from jwks import jwks
+from http_client import auth0_http
+from jwt_verifiers import InvalidClaims, TokenExpired, verifier
+from key_store import key_store
+import metrics
 
 log = logging.getLogger(__name__)
 
@@ -43,8 +50,9 @@ class TokenResult:
 
 
 def token_from_username_password(username, password) -> TokenResult:
-    r = requests.post(
+    r = auth0_http.post(
         auth0_url("oauth/token"),
+        name="oauth/token:password",
         json={
             "grant_type": "password",
             "username": username,
@@ -64,8 +72,10 @@ def token_from_username_password(username, password) -> TokenResult:
 
 
 def token_info_from_client_credentials(client_id, client_secret) -> dict:
-    r = requests.post(
+    r = auth0_http.post(
         auth0_url("oauth/token"),
+        name="oauth/token:client_credentials",
+        idempotent=True,
         json={
             "grant_type": "client_credentials",
             "client_id": client_id,
@@ -125,40 +135,63 @@ def token_result_from_header_value(
 
 def get_userinfo(token) -> dict:
 
-    return requests.get(
-        auth0_url("userinfo"), headers={"Authorization": f"Bearer {token}"}
+    return auth0_http.get(
+        auth0_url("userinfo"),
+        name="userinfo",
+        headers={"Authorization": f"Bearer {token}"},
     ).json()
 
 
 def parse_it(token, audience) -> dict:
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
-
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"],
-            }
-
-    if rsa_key:
+    """ Verify token for audience and return its claims
+
+    Verified claims are kept in a bounded cache keyed by a digest of the
+    token and the audience until the token's own `exp`, so clients resending
+    the same token skip the signature check.
+    """
+    key = _verified_token_key(token, audience)
+    payload = _verified_tokens.get(key)
+
+    if payload is None:
+        payload = _verify_token(token, audience)
+
+        if "exp" in payload:
+            _verified_tokens.set(key, payload, expires_at=payload["exp"])
+
+    return dict(payload)
+
+
+def _verified_token_key(token, audience) -> bytes:
+    digest = hashlib.sha256(token.encode())
+    digest.update(b"\0")
+    digest.update(str(audience).encode())
+
+    return digest.digest()
+
+
+_verified_tokens = TTLCache(maxsize=env.AUTH0_TOKEN_CACHE_SIZE)
+metrics.register("auth0_token_cache", _verified_tokens.stats)
+
+
+def _verify_token(token, audience) -> dict:
+    unverified_header = verifier.unverified_header(token)
+    key = key_store.get(unverified_header.get("kid"))
+
+    if key is not None:
         try:
-            payload = jwt.decode(
+            payload = verifier.verify(
                 token,
-                rsa_key,
-                algorithms=env.AUTH0_ALGORITHMS,
+                key,
                 audience=audience,
                 issuer=auth0_url(),
+                algorithms=env.AUTH0_ALGORITHMS,
             )
-        except jwt.ExpiredSignatureError:
+        except TokenExpired:
             raise AuthError(
                 {"code": "token_expired", "description": "token is expired"},
                 401,
             )
-        except jwt.JWTClaimsError as claims_error:
+        except InvalidClaims as claims_error:
             raise AuthError(
                 {
                     "code": "invalid_claims",
@@ -188,32 +221,128 @@ def parse_it(token, audience) -> dict:
 
 
 class ManagementAPI(object):
-    def __init__(self):
+    def __init__(
+        self,
+        renew_window=timedelta(seconds=env.AUTH0_MGMT_TOKEN_RENEW_WINDOW),
+        background_refresh=env.AUTH0_MGMT_TOKEN_BACKGROUND_REFRESH,
+    ):
         self.grant_type = "client_credentials"
+        self.renew_window = renew_window
+        self.background_refresh = background_refresh
         self._current_access_token = None
+        self._renew_lock = threading.Lock()
+        self._refresher = None
+        self._refresher_pid = None
         self._api_base = auth0_url("api/v2/")
         self._users_api_url = urljoin(self._api_base, "users")
+        self._userinfo = TTLCache(
+            maxsize=env.AUTH0_USERINFO_CACHE_SIZE,
+            ttl=env.AUTH0_USERINFO_CACHE_TTL,
+        )
+        self._userinfo_flight = SingleFlight()
 
     def _access_token(self):
-        if self._current_access_token:
-            expire_max = self._current_access_token.expires + timedelta(
-                minutes=30
-            )
-
-            if expire_max > datetime.utcnow():
-                log.debug(
-                    "ManagementAPI token expires soon(%s). Renewing",
-                    self._current_access_token.expires,
+        """The cached management token, renewed once it is inside
+        `renew_window` of expiring. Renewal is single flight: while one
+        caller renews, the others keep using the still valid token, or wait
+        for the renewal if there is no valid token"""
+
+        if self.background_refresh:
+            self._ensure_refresher()
+        token = self._current_access_token
+
+        if token is None or token.is_expired():
+            with self._renew_lock:
+                if self._current_access_token is token:
+                    self._renew()
+
+            return self._current_access_token
+
+        if self._needs_renewal(token) and self._renew_lock.acquire(
+            blocking=False
+        ):
+            try:
+                if self._current_access_token is token:
+                    log.debug(
+                        "ManagementAPI token expires soon(%s). Renewing",
+                        token.expires,
+                    )
+                    self._renew()
+            except Exception:
+                log.warning(
+                    "Failed to renew ManagementAPI token expiring %s",
+                    token.expires,
+                    exc_info=True,
                 )
-                self._renew()
-        else:
-            self._renew()
+            finally:
+                self._renew_lock.release()
 
         return self._current_access_token
 
+    def _needs_renewal(self, token) -> bool:
+        return token.expires - self._renew_window(token) <= datetime.utcnow()
+
+    def _renew_window(self, token) -> timedelta:
+        """`renew_window`, but at most half the token's lifetime, so a token
+        living shorter than the window isn't renewed again right away"""
+        claims = token.access_token
+
+        if "iat" in claims:
+            lifetime = claims["exp"] - claims["iat"]
+        else:
+            lifetime = token.result.get("expires_in")
+
+        if not lifetime:
+            return self.renew_window
+
+        return min(self.renew_window, timedelta(seconds=lifetime / 2))
+
+    def _ensure_refresher(self):
+        # Threads don't survive a fork, so each worker starts its own
+        if self._refresher_pid == os.getpid():
+            return
+
+        with self._renew_lock:
+            if self._refresher_pid != os.getpid():
+                self._refresher = threading.Thread(
+                    target=self._refresh_forever,
+                    name="auth0-management-token",
+                    daemon=True,
+                )
+                self._refresher.start()
+                self._refresher_pid = os.getpid()
+
+    def _refresh_forever(self):
+        """Keep the token renewed ahead of `renew_window` so requests don't
+        have to"""
+
+        while True:
+            try:
+                with self._renew_lock:
+                    token = self._current_access_token
+
+                    if token is None or self._needs_renewal(token):
+                        self._renew()
+                        token = self._current_access_token
+            except Exception:
+                log.warning(
+                    "Background ManagementAPI token renewal failed",
+                    exc_info=True,
+                )
+                time.sleep(env.AUTH0_MGMT_TOKEN_RETRY_INTERVAL)
+
+                continue
+
+            wait = (
+                token.expires - self._renew_window(token) - datetime.utcnow()
+            )
+            time.sleep(max(wait.total_seconds(), 1))
+
     def _renew(self):
-        res = requests.post(
+        res = auth0_http.post(
             auth0_url("oauth/token"),
+            name="oauth/token:management",
+            idempotent=True,
             json=dict(
                 grant_type=self.grant_type,
                 client_id=env.AUTH0_CLIENT_ID,
@@ -243,8 +372,9 @@ class ManagementAPI(object):
         }
 
     def create_user(self, user, password: str):
-        res = requests.post(
+        res = auth0_http.post(
             self._users_api_url,
+            name="management:create_user",
             json={
                 "email": user.email,
                 "password": password,
@@ -271,18 +401,59 @@ class ManagementAPI(object):
         return res.json()
 
     def get_userinfo(self, sub: str):
-        res = requests.get(
+        """Auth0 user profile for sub, cached for AUTH0_USERINFO_CACHE_TTL.
+        Unknown subs are remembered for AUTH0_USERINFO_NEGATIVE_TTL and
+        concurrent lookups of the same sub share one remote call"""
+        userinfo_result = self._userinfo.get(sub)
+
+        if userinfo_result is None:
+            userinfo_result = self._userinfo_flight.do(
+                sub, lambda: self._fetch_userinfo(sub)
+            )
+
+        if userinfo_result is _UNKNOWN_USER:
+            raise AuthError(
+                {
+                    "code": "unknown_user",
+                    "description": "User not found in auth0",
+                },
+                401,
+            )
+
+        return dict(userinfo_result)
+
+    def _fetch_userinfo(self, sub: str):
+        res = auth0_http.get(
             urljoin(self._users_api_url.rstrip("/") + "/", sub),
+            name="management:get_user",
             headers=self._headers(),
         )
+
+        if res.status_code == 404:
+            log.warning("No auth0 user for %s", sub)
+            self._userinfo.set(
+                sub, _UNKNOWN_USER, ttl=env.AUTH0_USERINFO_NEGATIVE_TTL
+            )
+
+            return _UNKNOWN_USER
         parse_status_code(res)
 
         userinfo_result = res.json()
         # Paste over the main difference between id_token and userinfo
         userinfo_result.setdefault("sub", userinfo_result.get("user_id"))
+        self._userinfo.set(sub, userinfo_result)
 
         return userinfo_result
 
+    def userinfo_stats(self) -> dict:
+        return {
+            **self._userinfo.stats(),
+            "coalesced": self._userinfo_flight.coalesced,
+        }
+
+
+_UNKNOWN_USER = object()
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code, reauth=False):
@@ -291,6 +462,19 @@ class AuthError(Exception):
         self.reauth = reauth
 
 
+def is_unavailable(ex) -> bool:
+    """True when ex means Auth0 couldn't answer (outage, rate limit, open
+    circuit) rather than that it rejected the request"""
+
+    if isinstance(ex, AuthError):
+        return ex.status_code in (429, 503)
+
+    if isinstance(ex, requests.HTTPError):
+        return ex.response is not None and ex.response.status_code >= 500
+
+    return isinstance(ex, (requests.ConnectionError, requests.Timeout))
+
+
 def parse_status_code(res):
     if res.status_code in (409, 400, 429):  # duplicate user
         raise AuthError(error=res.json(), status_code=res.status_code)
@@ -310,3 +494,4 @@ def request_bearer_token(request) -> str:
 
 
 management_api = ManagementAPI()
+metrics.register("auth0_userinfo_cache", management_api.userinfo_stats)
@@ -0,0 +1,134 @@
+"""Micro-benchmark of the token verification backends in jwt_verifiers
+
+Generates an RSA key and a corpus of signed tokens shaped like our Auth0
+access tokens, then verifies the whole corpus with every backend and reports
+tokens/sec and latency percentiles. The verified-token cache in auth0 is
+bypassed, so this measures cache misses.
+
+    python bench_jwt.py --tokens 2000 --rounds 3
+"""
+import argparse
+import base64
+import json
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from jwt_verifiers import backends
+
+AUDIENCE = "https://bench.example.com"
+ISSUER = "https://bench.example.com/"
+
+
+def _b64(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64_json(obj) -> bytes:
+    return _b64(json.dumps(obj, separators=(",", ":")).encode())
+
+
+def make_key():
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
+    )
+    numbers = private_key.public_key().public_numbers()
+
+    def _int(value):
+        return _b64(
+            value.to_bytes((value.bit_length() + 7) // 8, "big")
+        ).decode()
+
+    key_data = {
+        "alg": "RS256",
+        "kty": "RSA",
+        "use": "sig",
+        "kid": "bench",
+        "n": _int(numbers.n),
+        "e": _int(numbers.e),
+    }
+
+    return private_key, key_data
+
+
+def make_tokens(private_key, count):
+    header = _b64_json({"alg": "RS256", "typ": "JWT", "kid": "bench"})
+    now = int(time.time())
+    tokens = []
+
+    for i in range(count):
+        claims = {
+            "iss": ISSUER,
+            "sub": f"auth0|{i:024x}",
+            "aud": [AUDIENCE, ISSUER + "userinfo"],
+            "iat": now,
+            "exp": now + 3600,
+            "azp": "bench",
+            "scope": "openid profile email",
+        }
+        signing_input = header + b"." + _b64_json(claims)
+        signature = private_key.sign(
+            signing_input, padding.PKCS1v15(), hashes.SHA256()
+        )
+        tokens.append((signing_input + b"." + _b64(signature)).decode())
+
+    return tokens
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+
+    return sorted_values[index]
+
+
+def bench(verifier, key, tokens, rounds):
+    latencies = []
+    started = time.perf_counter()
+
+    for _ in range(rounds):
+        for token in tokens:
+            t0 = time.perf_counter()
+            verifier.verify(token, key, AUDIENCE, ISSUER, ["RS256"])
+            latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        "tokens/sec": len(latencies) / elapsed,
+        "p50 ms": percentile(latencies, 50) * 1000,
+        "p99 ms": percentile(latencies, 99) * 1000,
+        "max ms": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--backend",
+        action="append",
+        choices=sorted(backends),
+        help="Backend(s) to run, default all",
+    )
+    args = parser.parse_args()
+
+    private_key, key_data = make_key()
+    tokens = make_tokens(private_key, args.tokens)
+    print(f"{len(tokens)} tokens x {args.rounds} rounds")
+
+    for name in args.backend or sorted(backends):
+        verifier = backends[name]()
+        key = verifier.load_key(key_data)
+        verifier.verify(tokens[0], key, AUDIENCE, ISSUER, ["RS256"])
+        result = bench(verifier, key, tokens, args.rounds)
+        print(
+            f"{name:>14}: "
+            + "  ".join(f"{k} {v:10.3f}" for k, v in result.items())
+        )
+
+
+if __name__ == "__main__":
+    main()
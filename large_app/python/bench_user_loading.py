@@ -0,0 +1,135 @@
+"""Benchmark of the ways a User can be loaded with its relationships
+
+Seeds a user with many alert subscriptions and locations in the configured
+database, then loads it with the old global joined eager loading, with the
+default (what authentication does now) and with `User.with_details()` (what
+GET /user does now). Reports statements, rows fetched and latency
+percentiles per strategy. The seeded rows are deleted afterwards.
+
+    python bench_user_loading.py --alerts 20 --locations 10 --rounds 50
+"""
+import argparse
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+from api import create_app
+from models import AlertSubscription, AlertType, db, User
+from models.user import UserLocation
+from query_stats import collect_queries
+
+
+def seed(alerts, locations) -> int:
+    tag = uuid.uuid4().hex[:12]
+
+    with db as session:
+        alert_types = [
+            AlertType(name=f"bench {tag} {i}", description="bench")
+            for i in range(alerts)
+        ]
+        user = User(name="bench", email=f"bench-{tag}@example.com")
+        user.locations = [
+            UserLocation(name=f"location {i}", city="bench")
+            for i in range(locations)
+        ]
+        user.alert_subscriptions = [
+            AlertSubscription(alert_type=alert_type, enabled=True)
+            for alert_type in alert_types
+        ]
+        session.add(user)
+        session.commit()
+
+        return user.id
+
+
+def cleanup(user_id) -> None:
+    with db as session:
+        user = session.query(User).get(user_id)
+        alert_types = [s.alert_type for s in user.alert_subscriptions]
+
+        for row in user.alert_subscriptions + user.locations + alert_types:
+            session.delete(row)
+        session.delete(user)
+        session.commit()
+
+
+strategies = {
+    "joined (old default)": lambda: User.query.options(
+        joinedload(User.locations),
+        joinedload(User.alert_subscriptions).joinedload("alert_type"),
+    ),
+    "auth (default)": lambda: User.query,
+    "GET /user (with_details)": User.with_details,
+}
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+
+    return sorted_values[index]
+
+
+def bench(make_query, user_id, rounds, dump):
+    rows = []
+
+    def count_rows(conn, cursor, *args):
+        rows.append(max(cursor.rowcount, 0))
+
+    event.listen(db.engine, "after_cursor_execute", count_rows)
+    latencies = []
+    try:
+        with collect_queries() as queries:
+            for _ in range(rounds):
+                with db:
+                    t0 = time.perf_counter()
+                    user = make_query().get(user_id)
+
+                    if dump:
+                        User.schema.dump(user)
+                    latencies.append(time.perf_counter() - t0)
+    finally:
+        event.remove(db.engine, "after_cursor_execute", count_rows)
+    latencies.sort()
+
+    # Both per round, averaged over all rounds
+    return {
+        "queries": queries.count / rounds,
+        "rows": sum(rows) / rounds,
+        "p50 ms": percentile(latencies, 50) * 1000,
+        "p99 ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alerts", type=int, default=20)
+    parser.add_argument("--locations", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument(
+        "--dump",
+        action="store_true",
+        help="Also serialize with UserSchema, as GET /user does",
+    )
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        user_id = seed(args.alerts, args.locations)
+        print(
+            f"user with {args.alerts} alerts x {args.locations} locations,"
+            f" {args.rounds} rounds"
+        )
+        try:
+            for name, make_query in strategies.items():
+                result = bench(make_query, user_id, args.rounds, args.dump)
+                print(
+                    f"{name:>26}: "
+                    + "  ".join(f"{k} {v:8.2f}" for k, v in result.items())
+                )
+        finally:
+            cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
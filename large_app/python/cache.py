@@ -0,0 +1,136 @@
+"""Small in-process caches shared by the auth and model layers"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache(object):
+    """Bounded, thread safe LRU where every entry carries its own expiry.
+
+    Entries are dropped when they are older than `ttl` seconds or when the
+    absolute `expires_at` (unix timestamp) given to `set` has passed,
+    whichever comes first. The least recently used entry is evicted when the
+    cache is full.
+    """
+
+    def __init__(self, maxsize, ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = self._clock()
+
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None:
+                self.misses += 1
+
+                return default
+
+            value, expires_at = entry
+
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value, expires_at=None, ttl=None):
+        if self.maxsize <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+
+        if ttl is not None:
+            ttl_expiry = self._clock() + ttl
+            expires_at = (
+                ttl_expiry
+                if expires_at is None
+                else min(expires_at, ttl_expiry)
+            )
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls for the same key: the first caller runs the
+    function, the others wait and share its result (or exception)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,74 @@
+"""Connection pool settings and instrumentation for the Flask-SQLAlchemy
+engines
+
+`engine_options()` is used as SQLALCHEMY_ENGINE_OPTIONS. Its pool records how
+long checkouts wait for a connection, how many are checked out and how
+often the pool had to overflow or timed out, exposed as "db_pool" on
+/metrics.
+"""
+import logging
+
+from sqlalchemy.pool import QueuePool
+
+import env
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Latest pool per name. An engine replaces its pool on dispose()
+_pools = {}
+
+
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, creator, **kwargs):
+        super().__init__(creator, **kwargs)
+        name = self._orig_logging_name or "default"
+        # Counters carry over to the pool that replaces this one
+        previous = _pools.get(name)
+        self.wait_timing = (
+            previous.wait_timing if previous else metrics.Timing()
+        )
+        self.overflows = previous.overflows if previous else 0
+        _pools[name] = self
+
+    def _do_get(self):
+        # Timeouts count as errors of the wait timing
+        with self.wait_timing.time():
+            return super()._do_get()
+
+    def _inc_overflow(self):
+        created = super()._inc_overflow()
+
+        if created and self._overflow > 0:
+            self.overflows += 1
+            log.info("Connection pool overflowing: %s", self.status())
+
+        return created
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "overflows": self.overflows,
+            "checkout_wait": self.wait_timing.stats(),
+        }
+
+
+def engine_options(name=None) -> dict:
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": env.DB_POOL_SIZE,
+        "max_overflow": env.DB_POOL_MAX_OVERFLOW,
+        "pool_timeout": env.DB_POOL_TIMEOUT,
+        "pool_recycle": env.DB_POOL_RECYCLE,
+        "pool_pre_ping": env.DB_POOL_PRE_PING,
+        "pool_logging_name": name,
+    }
+
+
+def stats() -> dict:
+    return {name: pool.stats() for name, pool in sorted(_pools.items())}
+
+
+metrics.register("db_pool", stats)
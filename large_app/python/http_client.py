@@ -0,0 +1,266 @@
+"""Shared, pooled HTTP client for outgoing calls to Auth0
+
+One keep-alive `requests.Session` per process (rebuilt after a fork) with
+connect/read timeouts and bounded retries with exponential backoff on
+connection errors and 5xx responses. Only idempotent calls are retried.
+A circuit breaker fails calls fast while the remote end keeps failing.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import env
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """ Raised instead of calling a host that is currently failing """
+
+
+class CircuitBreaker(object):
+    """Stops calls after `failure_threshold` consecutive failures (errors,
+    timeouts and 5xx). After `reset_timeout` seconds a single trial call
+    is let through; its outcome closes or re-opens the circuit.
+
+    `before_call` returns the generation the call belongs to, which moves on
+    whenever the circuit opens or half opens. Outcomes reported for an
+    older generation (calls that started before the circuit opened) are
+    ignored."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self, failure_threshold=5, reset_timeout=30, clock=time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self.rejected = 0
+        self.generation = 0
+        self._trial_in_flight = False
+
+    def before_call(self) -> int:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return self.generation
+
+            if (
+                self.state == self.OPEN
+                and self._clock() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = self.HALF_OPEN
+                self.generation += 1
+
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+
+                return self.generation
+            self.rejected += 1
+
+        raise CircuitOpenError("Circuit open, not calling")
+
+    def record_success(self, generation=None) -> None:
+        with self._lock:
+            if not self._current(generation):
+                return
+
+            if self.state != self.CLOSED:
+                log.info("Circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, generation=None) -> None:
+        with self._lock:
+            if not self._current(generation):
+                return
+            self.failures += 1
+            self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and self.failures >= self.failure_threshold
+            ):
+                log.warning("Circuit opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = self._clock()
+                self.opened += 1
+                self.generation += 1
+
+    def _current(self, generation) -> bool:
+        return generation is None or generation == self.generation
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class HTTPClient(object):
+    def __init__(
+        self,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+        retries=2,
+        backoff=0.2,
+        breaker=None,
+    ):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.timings = metrics.Timings()
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._pid = None
+
+    @property
+    def session(self) -> requests.Session:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._connect()
+
+        return self._session
+
+    def _connect(self):
+        # Sockets must never be shared with a parent process (gunicorn
+        # preload), so every process builds its own session
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._session, self._adapter = session, adapter
+        self._pid = os.getpid()
+
+    def request(
+        self, method, url, name=None, idempotent=None, **kwargs
+    ) -> requests.Response:
+        """Send a request. `name` groups the call in the latency stats"""
+        name = name or method
+        kwargs.setdefault("timeout", self.timeout)
+
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+        attempts = 1 + self.retries if idempotent else 1
+
+        for attempt in range(1, attempts + 1):
+            generation = self.breaker.before_call()
+            started = time.perf_counter()
+            try:
+                res = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.timings[name].observe(
+                    time.perf_counter() - started, error=True
+                )
+                self.breaker.record_failure(generation)
+
+                if attempt == attempts:
+                    raise
+                log.warning(
+                    "%s %s failed (attempt %s)",
+                    method,
+                    url,
+                    attempt,
+                    exc_info=True,
+                )
+                self._sleep(attempt)
+
+                continue
+            except Exception:
+                # Anything else (broken chunked responses, redirect loops)
+                # is not retried, but must still settle a half-open trial
+                self.timings[name].observe(
+                    time.perf_counter() - started, error=True
+                )
+                self.breaker.record_failure(generation)
+
+                raise
+
+            self.timings[name].observe(
+                time.perf_counter() - started, error=res.status_code >= 500
+            )
+
+            # A 429 is a rate limit on this tenant, not an outage, and must
+            # not fail calls to other endpoints fast
+            if res.status_code >= 500:
+                self.breaker.record_failure(generation)
+            else:
+                self.breaker.record_success(generation)
+
+            if res.status_code < 500 or attempt == attempts:
+                return res
+            log.warning(
+                "%s %s returned %s (attempt %s)",
+                method,
+                url,
+                res.status_code,
+                attempt,
+            )
+            self._sleep(attempt)
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _sleep(self, attempt):
+        time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.timings.stats(),
+            "pools": self._pool_stats(),
+            "breaker": self.breaker.stats(),
+        }
+
+    def _pool_stats(self) -> list:
+        if self._adapter is None or self._pid != os.getpid():
+            return []
+        pools = self._adapter.poolmanager.pools
+
+        return [
+            {
+                "host": pool.host,
+                "maxsize": pool.pool.maxsize,
+                "in_use": pool.pool.maxsize - pool.pool.qsize(),
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+            for pool in (pools[key] for key in pools.keys())
+            if pool.pool is not None
+        ]
+
+
+auth0_http = HTTPClient(
+    pool_size=env.AUTH0_HTTP_POOL_SIZE,
+    connect_timeout=env.AUTH0_HTTP_CONNECT_TIMEOUT,
+    read_timeout=env.AUTH0_HTTP_READ_TIMEOUT,
+    retries=env.AUTH0_HTTP_RETRIES,
+    backoff=env.AUTH0_HTTP_BACKOFF,
+    breaker=CircuitBreaker(
+        failure_threshold=env.AUTH0_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=env.AUTH0_BREAKER_RESET_TIMEOUT,
+    ),
+)
+metrics.register("auth0_http", auth0_http.stats)
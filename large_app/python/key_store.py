@@ -0,0 +1,114 @@
+"""kid indexed store of the public keys used to verify Auth0 tokens"""
+import json
+import logging
+import threading
+import time
+
+import env
+from http_client import auth0_http
+from jwks import jwks
+from jwt_verifiers import verifier
+
+log = logging.getLogger(__name__)
+
+
+class KeyStore(object):
+    """Public keys indexed by `kid`, built once per (re)load with `build_key`
+    (a verifier's `load_key`).
+
+    `source` is a JWKS url or file path that is read on `reload()`. Looking
+    up an unknown kid triggers a reload, at most once every
+    `min_refresh_interval` seconds, to pick up rotated keys without a deploy.
+    """
+
+    def __init__(
+        self,
+        keys=None,
+        source=None,
+        min_refresh_interval=300,
+        build_key=verifier.load_key,
+    ):
+        self.source = source
+        self.min_refresh_interval = min_refresh_interval
+        self._build_key = build_key
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._last_refresh = None
+
+        if keys:
+            self.load(keys)
+
+    def load(self, key_set: dict) -> None:
+        keys = {}
+
+        for key_data in key_set.get("keys", []):
+            if key_data.get("use", "sig") != "sig" or "kid" not in key_data:
+                continue
+            try:
+                keys[key_data["kid"]] = self._build_key(key_data)
+            except Exception:
+                log.warning(
+                    "Unable to build key %s",
+                    key_data.get("kid"),
+                    exc_info=True,
+                )
+        self._keys = keys
+        log.info("Loaded signing keys %s", sorted(keys))
+
+    def reload(self) -> None:
+        self.load(self._fetch())
+
+    def get(self, kid):
+        key = self._keys.get(kid)
+
+        if key is None and self.refresh():
+            key = self._keys.get(kid)
+
+        return key
+
+    def refresh(self) -> bool:
+        """Rate limited reload. Returns True if the keys were reloaded"""
+
+        if not self.source:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+
+            if (
+                self._last_refresh is not None
+                and now - self._last_refresh < self.min_refresh_interval
+            ):
+                return False
+            self._last_refresh = now
+
+        try:
+            self.reload()
+        except Exception:
+            log.warning(
+                "Failed to reload keys from %s", self.source, exc_info=True
+            )
+
+            return False
+
+        return True
+
+    def _fetch(self) -> dict:
+        if self.source.startswith(("http://", "https://")):
+            res = auth0_http.get(self.source, name="jwks")
+            res.raise_for_status()
+
+            return res.json()
+
+        with open(self.source) as f:
+            return json.load(f)
+
+    def __contains__(self, kid):
+        return kid in self._keys
+
+
+key_store = KeyStore(
+    jwks,
+    source=env.AUTH0_JWKS_SOURCE,
+    min_refresh_interval=env.AUTH0_JWKS_MIN_REFRESH_INTERVAL,
+)
@@ -0,0 +1,116 @@
+"""Process local counters and timings, exposed as json on /metrics
+
+Modules register a provider (a callable returning a json-able dict) under a
+name and `snapshot()` collects them all.
+"""
+from contextlib import contextmanager
+import hmac
+import threading
+import time
+
+import env
+
+_providers = {}
+_LOOPBACK = ("127.0.0.1", "::1")
+
+
+def register(name, provider) -> None:
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    return {name: provider() for name, provider in sorted(_providers.items())}
+
+
+def authorized(req) -> bool:
+    """Whether req may read the metrics: it carries METRICS_TOKEN as a
+    bearer token or, when no token is configured, comes from loopback"""
+
+    if not env.METRICS_TOKEN:
+        return req.remote_addr in _LOOPBACK
+    scheme, _, token = req.headers.get("authorization", "").partition(" ")
+
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        token.encode(), env.METRICS_TOKEN.encode()
+    )
+
+
+class Counters(object):
+    """Named counters that can be incremented from any thread"""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(names, 0)
+
+    def incr(self, name, n=1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def __getitem__(self, name) -> int:
+        return self._counts.get(name, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+class Timing(object):
+    """Count, errors, total and max of observed durations"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, error=False) -> None:
+        with self._lock:
+            self.count += 1
+            self.errors += int(error)
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(time.perf_counter() - started, error=True)
+            raise
+        self.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": (
+                round(self.total * 1000 / self.count, 3) if self.count else 0.0
+            ),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Timings(object):
+    """A Timing per name, created on first use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+
+    def __getitem__(self, name) -> Timing:
+        timing = self._timings.get(name)
+
+        if timing is None:
+            with self._lock:
+                timing = self._timings.setdefault(name, Timing())
+
+        return timing
+
+    def stats(self) -> dict:
+        return {
+            name: timing.stats()
+            for name, timing in sorted(self._timings.items())
+        }
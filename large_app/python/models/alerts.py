@@ -1,10 +1,28 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, Text
+from dataclasses import dataclass
+import logging
+import threading
+import time
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    event,
+    ForeignKey,
+    func,
+    Integer,
+    select,
+    Text,
+)
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
+import env
+import metrics
 from .database import db
 from .mixins import LifeCycleMixin, StandardObjectMixin
 
+log = logging.getLogger(__name__)
+
 
 class AlertType(StandardObjectMixin, db.Model):
     name = Column(Text)
@@ -13,15 +31,125 @@ class AlertType(StandardObjectMixin, db.Model):
 
 class AlertSubscription(LifeCycleMixin, db.Model):
     alert_type_id = Column(Integer, ForeignKey(AlertType.id), primary_key=True)
-    alert_type = relationship(AlertType, uselist=False, lazy="joined")
-    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    alert_type = relationship(AlertType, uselist=False)
+    user_id = Column(
+        Integer, ForeignKey("user.id"), primary_key=True, index=True
+    )
     enabled = Column(Boolean, default=False, server_default="false")
     channels = Column(JSONB)
 
     @property
     def name(self):
-        return self.alert_type.name
+        alert_type = alert_types.get(self.alert_type_id)
+
+        return alert_type.name if alert_type else None
 
     @property
     def description(self):
-        return self.alert_type.description
+        alert_type = alert_types.get(self.alert_type_id)
+
+        return alert_type.description if alert_type else None
+
+
+@dataclass(frozen=True)
+class AlertTypeInfo:
+    id: int
+    name: str
+    description: str
+
+
+class AlertTypeRegistry(object):
+    """All alert types, kept in memory so subscriptions don't load them.
+
+    At most every `check_interval` seconds the row count and latest `updated`
+    of alert_type are compared with those of the loaded types, and the types
+    are reloaded if either changed. Writes through the ORM skip the wait, and
+    so does the first unknown id in each interval; other unknown ids are None
+    until the next check. Types are loaded on the first `get()`, and a
+    failed refresh keeps serving the types loaded before it.
+    """
+
+    def __init__(self, check_interval=60, clock=time.monotonic):
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._types = {}
+        self._version = None
+        self._checked_at = None
+        self._forced_at = None
+        self.reloads = 0
+
+    def get(self, alert_type_id) -> AlertTypeInfo:
+        self.refresh()
+        alert_type = self._types.get(alert_type_id)
+
+        if alert_type is None and alert_type_id is not None:
+            self.refresh(force=True)
+            alert_type = self._types.get(alert_type_id)
+
+        return alert_type
+
+    def invalidate(self) -> None:
+        self._checked_at = None
+
+    def refresh(self, force=False) -> None:
+        if not self._due(force):
+            return
+
+        with self._lock:
+            if not self._due(force):
+                return
+
+            if force:
+                self._forced_at = self._clock()
+            try:
+                self._reload_if_changed()
+            except Exception:
+                # Keep the types loaded last and try again after the interval
+                log.warning("Refreshing alert types failed", exc_info=True)
+            self._checked_at = self._clock()
+
+    def _reload_if_changed(self):
+        table = AlertType.__table__
+
+        # On a connection of its own, so the session of whoever asked (e.g.
+        # a response being serialized) is left alone
+        with db.engine.connect() as connection:
+            version = tuple(
+                connection.execute(
+                    select([func.count(table.c.id), func.max(table.c.updated)])
+                ).first()
+            )
+
+            if version == self._version:
+                return
+            rows = connection.execute(
+                select([table.c.id, table.c.name, table.c.description])
+            )
+            self._types = {row.id: AlertTypeInfo(*row) for row in rows}
+        self._version = version
+        self.reloads += 1
+
+    def _due(self, force=False) -> bool:
+        # Forced checks have an interval of their own, so ids that don't
+        # exist can't make every get() hit the database
+        checked_at = self._forced_at if force else self._checked_at
+
+        return (
+            checked_at is None
+            or self._clock() - checked_at >= self.check_interval
+        )
+
+    def stats(self) -> dict:
+        return {"size": len(self._types), "reloads": self.reloads}
+
+
+alert_types = AlertTypeRegistry(check_interval=env.ALERT_TYPE_CHECK_INTERVAL)
+metrics.register("alert_types", alert_types.stats)
+
+
+@event.listens_for(AlertType, "after_insert")
+@event.listens_for(AlertType, "after_update")
+@event.listens_for(AlertType, "after_delete")
+def _invalidate_alert_types(mapper, connection, alert_type):
+    alert_types.invalidate()
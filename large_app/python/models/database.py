@@ -1,11 +1,186 @@
-from flask_sqlalchemy import SQLAlchemy
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import random
+
+from flask import request
+from flask_sqlalchemy import get_state, SignallingSession, SQLAlchemy
+from sqlalchemy import orm, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+from cache import TTLCache
+import env
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Seconds the replica is behind, 0 while it has replayed all it received
+_REPLICA_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) "
+    "END"
+)
+
+
+class RoutingSession(SignallingSession):
+    """Sends reads to a replica while the session is in replica mode and
+    everything else to the primary. Once the session writes (flushes,
+    executes DML or locks rows) it stays on the primary, so it reads its
+    own writes for the rest of the request."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or _is_write(clause):
+            self.info["pinned"] = True
+        elif self.info.get("use_replica") and not self.info.get("pinned"):
+            engine = get_state(self.app).db.replica_engine(self)
+
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with optional read replicas (PGDB_REPLICA_CONNECTION_STRINGS)
+
+    GET/HEAD requests and blocks in `replica()` read from a replica, chosen
+    per session. A replica lagging more than PGDB_REPLICA_MAX_LAG seconds,
+    or failing the lag check, is skipped in favour of the primary.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica_binds = {}
+        self._replica_health = TTLCache(
+            maxsize=64, ttl=env.PGDB_REPLICA_LAG_CHECK_INTERVAL
+        )
+        self.routing_stats = metrics.Counters("replica", "primary_fallback")
+        metrics.register("db_routing", self.routing_stats.stats)
+
+    def init_app(self, app):
+        self.replica_binds = {
+            f"replica_{i}": url
+            for i, url in enumerate(env.PGDB_REPLICA_CONNECTION_STRINGS)
+        }
+        app.config["SQLALCHEMY_BINDS"] = {
+            **(app.config.get("SQLALCHEMY_BINDS") or {}),
+            **self.replica_binds,
+        }
+        super().init_app(app)
+
+        if self.replica_binds:
+            app.before_request(self._route_reads)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        # Name the replica pools so their metrics are told apart
+        for key, url in self.replica_binds.items():
+            if str(make_url(url)) == str(sa_url):
+                engine_opts = {**engine_opts, "pool_logging_name": key}
+
+        return super().create_engine(sa_url, engine_opts)
+
+    def _route_reads(self):
+        if request.method in ("GET", "HEAD"):
+            self.session().info["use_replica"] = True
+
+    @contextmanager
+    def replica(self):
+        """Read from a replica in this block, unless the session has already
+        written. Also usable as a decorator"""
+
+        if not self.replica_binds:
+            yield
+
+            return
+
+        info = self.session().info
+        previous = info.get("use_replica", False)
+        info["use_replica"] = True
+        try:
+            yield
+        finally:
+            info["use_replica"] = previous
+
+    def use_primary(self) -> None:
+        """Keep the current session on the primary, e.g. ahead of writes it
+        makes outside the session or to take locks"""
+        self.session().info["pinned"] = True
+
+    def replica_engine(self, session):
+        if not self.replica_binds:
+            return None
+
+        key = session.info.get("replica")
+
+        if key is None:
+            key = session.info["replica"] = random.choice(
+                list(self.replica_binds)
+            )
+
+        if not self._replica_usable(session.app, key):
+            self.routing_stats.incr("primary_fallback")
+
+            return None
+        self.routing_stats.incr("replica")
+
+        return self.get_engine(session.app, bind=key)
+
+    def _replica_usable(self, app, key) -> bool:
+        if not env.PGDB_REPLICA_MAX_LAG:
+            return True
+
+        usable = self._replica_health.get(key)
+
+        if usable is None:
+            usable = self._check_replica(app, key)
+            self._replica_health.set(key, usable)
+
+        return usable
+
+    def _check_replica(self, app, key) -> bool:
+        try:
+            with self.get_engine(app, bind=key).connect() as connection:
+                lag = connection.execute(_REPLICA_LAG).scalar()
+        except Exception:
+            log.warning("Lag check of %s failed", key, exc_info=True)
+
+            return False
+
+        if lag is None or lag > env.PGDB_REPLICA_MAX_LAG:
+            log.warning("%s is %ss behind, reading from primary", key, lag)
+
+            return False
+
+        return True
+
+
+def _is_write(clause) -> bool:
+    return isinstance(clause, UpdateBase) or (
+        getattr(clause, "_for_update_arg", None) is not None
+    )
 
 
 class Wrapper(object):
+    """`with db as session:` hands out the session of the current
+    thread/greenlet, closing it when the outermost block exits. The session
+    and nesting depth live in a ContextVar so concurrent requests never see
+    each other's state."""
+
     def __init__(self, sqlalchemy):
         self._db = sqlalchemy
-        self._session = None
-        self._nesting = 0
+        self._state = ContextVar(f"db_session_{id(self)}", default=(None, 0))
+
+    @property
+    def _session(self):
+        return self._state.get()[0]
+
+    @property
+    def _nesting(self):
+        return self._state.get()[1]
 
     @property
     def session(self):
@@ -20,22 +195,24 @@ class Wrapper(object):
         self._db.session = new_session
 
     def __enter__(self):
-        if self._session is None:
-            assert self._nesting == 0
-            self._session = self._db.session()
-        self._nesting += 1
+        session, nesting = self._state.get()
 
-        return self._session
+        if session is None:
+            assert nesting == 0
+            session = self._db.session()
+        self._state.set((session, nesting + 1))
+
+        return session
 
     def __exit__(self, type, value, _):
-        self._nesting -= 1
-        dirty = bool(
-            self._session.new or self._session.dirty or self._session.deleted
-        )
+        session, nesting = self._state.get()
+        nesting -= 1
+        dirty = bool(session.new or session.dirty or session.deleted)
 
-        if self._nesting == 0:
-            self._session.close()
-            self._session = None
+        if nesting == 0:
+            session.close()
+            session = None
+        self._state.set((session, nesting))
 
         if value is None and dirty:
             raise RuntimeError("Dirty session!")
@@ -44,4 +221,4 @@ class Wrapper(object):
         return getattr(self._db, k)
 
 
-db = Wrapper(SQLAlchemy())
+db = Wrapper(RoutingSQLAlchemy())
@@ -0,0 +1,107 @@
+"""Bounded pool for the PBKDF2 work of BasicCache
+
+Hashing runs on a fixed number of worker threads (hashlib releases the GIL
+while deriving) with a limited number of waiting jobs. When both are used
+up the request fails fast with a 503 instead of every request thread
+getting stuck in PBKDF2 during a login storm.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+import time
+
+import auth0
+import env
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class HashingExecutor(object):
+    def __init__(self, workers, queue_limit):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.in_flight = 0
+        self.running = 0
+        self.rejected = 0
+        self.wait_timing = metrics.Timing()
+        self.hash_timing = metrics.Timing()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Worker threads don't survive a fork
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="pbkdf2"
+                    )
+                    self._pid = os.getpid()
+
+        return self._executor
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for the result
+
+        Throws: AuthError(503) when the pool and its queue are full
+        """
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            log.warning("Hashing pool saturated, rejecting login")
+
+            raise auth0.AuthError(
+                {
+                    "code": "overloaded",
+                    "description": "Too many logins right now, try again",
+                },
+                503,
+            )
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self.executor.submit(
+                self._timed, time.perf_counter(), fn, *args
+            ).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _timed(self, submitted, fn, *args):
+        started = time.perf_counter()
+        self.wait_timing.observe(started - submitted)
+
+        with self._lock:
+            self.running += 1
+        try:
+            with self.hash_timing.time():
+                return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "queue_depth": max(self.in_flight - self.running, 0),
+            "running": self.running,
+            "rejected": self.rejected,
+            "wait": self.wait_timing.stats(),
+            "hash": self.hash_timing.stats(),
+        }
+
+
+hashing_executor = HashingExecutor(
+    workers=env.BASIC_CACHE_HASH_WORKERS,
+    queue_limit=env.BASIC_CACHE_HASH_QUEUE_LIMIT,
+)
+metrics.register("basic_cache_hashing", hashing_executor.stats)
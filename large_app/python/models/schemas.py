@@ -1,3 +1,4 @@
+from marshmallow import validate
 from marshmallow_sqlalchemy import TableSchema
 from .marshmallow import marshmallow as ma
 from .user import User, UserLocation
@@ -7,7 +8,7 @@ from .alerts import AlertSubscription, AlertType
 class UserSchema(TableSchema):
     class Meta:
         table = User.__table__
-        exclude = ("deleted", "created", "updated")
+        exclude = ("deleted", "created", "updated", "email_normalized")
         strict = True
 
     alerts = ma.List(
@@ -53,6 +54,22 @@ class AlertSubscriptionSchema(TableSchema):
         table = AlertSubscription.__table__
 
     alert_type = ma.Nested(AlertTypeSchema, many=False)
+    name = ma.String(dump_only=True)
+    description = ma.String(dump_only=True)
+
+
+class UserLocationSchema(TableSchema):
+    class Meta:
+        table = UserLocation.__table__
+        exclude = ("deleted", "created", "updated")
+
+
+class UserExportArgsSchema(ma.Schema):
+    fmt = ma.String(
+        data_key="format",
+        missing="ndjson",
+        validate=validate.OneOf(["ndjson", "csv"]),
+    )
 
 
 class ForgotPassword(ma.Schema):
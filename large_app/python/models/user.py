@@ -1,18 +1,25 @@
 """ Model for the User """
-from datetime import datetime
+from datetime import datetime, timedelta
 import hashlib
+import hmac
+import json
 import logging
 import os
 
 from flask_login import UserMixin
 from sqlalchemy import Boolean, DateTime, Text
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import insert, JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import selectinload, validates
 from sqlalchemy.sql.expression import true
 from sqlalchemy.types import CHAR, LargeBinary
 
 import auth0
+from cache import TTLCache
+import env
+import metrics
 from .database import db
+from .hashing import hashing_executor
 from .mixins import StandardObjectMixin
 
 log = logging.getLogger(__name__)
@@ -31,7 +38,7 @@ class UserLocation(StandardObjectMixin, db.Model):
     primary = db.Column(
         db.Boolean, default=False, server_default="false", nullable=False
     )
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
 
 
 class User(StandardObjectMixin, UserMixin, db.Model):
@@ -39,13 +46,29 @@ class User(StandardObjectMixin, UserMixin, db.Model):
     name = db.Column(Text, nullable=False)
     phone = db.Column(Text)
     email = db.Column(Text, unique=True, nullable=False)
+    # lower(email), kept in sync by _normalize_email, for indexed
+    # case-insensitive lookups
+    email_normalized = db.Column(Text, unique=True, index=True)
     locale = db.Column(Text)
     terms_accept = db.Column(Boolean)
     terms_accept_at = db.Column(DateTime)
 
-    alert_subscriptions = db.relationship("AlertSubscription", lazy="joined")
+    # Loaded on access. Endpoints that serialize them load them up front
+    # with `with_details()`, authentication never touches them
+    alert_subscriptions = db.relationship("AlertSubscription")
     # auth0_mapping = db.relationship("Auth0Mapping", uselist=False)
-    locations = db.relationship(UserLocation, lazy="joined")
+    locations = db.relationship(UserLocation)
+
+    @classmethod
+    def with_details(cls):
+        """ Query that loads the locations and alert subscriptions UserSchema
+        dumps, with one extra SELECT per collection instead of a join fan-out.
+        Alert names and descriptions come from the alert_types registry
+        """
+
+        return cls.query.options(
+            selectinload(cls.locations), selectinload(cls.alert_subscriptions)
+        )
 
     @classmethod
     def from_auth0(cls, user_info) -> ("User", bool):
@@ -61,7 +84,7 @@ class User(StandardObjectMixin, UserMixin, db.Model):
         update = False
         email = user_info["email"]
         user = cls.query.filter(
-            db.func.lower(cls.email) == email.lower()
+            cls.email_normalized == normalize_email(email)
         ).one_or_none()
 
         if not user:
@@ -79,7 +102,17 @@ class User(StandardObjectMixin, UserMixin, db.Model):
     def update_from_auth0(self, user_info) -> bool:
         """ Update current user with info from userinfo/id_token"""
 
-        changed = False
+        changes = self.changes_from_auth0(user_info)
+
+        for k, value in changes.items():
+            setattr(self, k, value)
+
+        return bool(changes)
+
+    def changes_from_auth0(self, user_info) -> dict:
+        """ The column values that differ from userinfo/id_token """
+
+        changes = {}
 
         for k in _relevant_user_info_fields(user_info):
             value = user_info[k]
@@ -94,20 +127,28 @@ class User(StandardObjectMixin, UserMixin, db.Model):
                 getattr(self, k),
                 self,
             )
-            changed = True
-            setattr(self, k, value)
+            changes[k] = value
+
+        if "email" in changes:
+            changes["email_normalized"] = normalize_email(changes["email"])
 
-        return changed
+        return changes
 
     def add_mapping(self, sub: str):
         self.auth0_mapping = Auth0Mapping(sub=sub)
 
         return self
 
+    @validates("email")
+    def _normalize_email(self, key, email):
+        self.email_normalized = normalize_email(email)
+
+        return email
+
     def exists(self):
         return (
             self.query.filter(
-                db.func.lower(User.email) == db.func.lower(self.email)
+                User.email_normalized == normalize_email(self.email)
             ).first()
             is not None
         )
@@ -116,6 +157,22 @@ class User(StandardObjectMixin, UserMixin, db.Model):
         return self.schema.dump(self).data
 
 
+def normalize_email(email: str) -> str:
+    """ The form emails are compared in: case-insensitive """
+
+    return email.lower() if email is not None else None
+
+
+def user_info_fingerprint(user_info) -> str:
+    """ Digest of the parts of userinfo/id_token we store on the user """
+
+    return hashlib.sha256(
+        json.dumps(
+            _relevant_user_info_fields(user_info), sort_keys=True, default=str
+        ).encode()
+    ).hexdigest()
+
+
 def _relevant_user_info_fields(user_info):
     return {
         k: v
@@ -143,10 +200,11 @@ class Auth0Mapping(db.Model):
 
     __tablename__ = "auth0_mapping"
     user_id = db.Column(db.Integer, db.ForeignKey(User.id), primary_key=True)
-    sub = db.Column(db.Text, nullable=False)
+    sub = db.Column(db.Text, nullable=False, unique=True, index=True)
     user = db.relationship(User, uselist=False)
 
     @classmethod
+    @db.replica()
     def get_from_sub(cls, sub):
         return cls.query.filter(Auth0Mapping.sub == sub).one_or_none()
 
@@ -162,7 +220,7 @@ class BasicCache(db.Model):
     username = db.Column(db.Text, primary_key=True)
     hashed = db.Column(LargeBinary)
     salt = db.Column(LargeBinary)
-    expires = db.Column(DateTime)
+    expires = db.Column(DateTime, index=True)
     access_token = db.Column(JSONB)
     id_token = db.Column(JSONB)
     result = db.Column(JSONB)
@@ -178,16 +236,59 @@ class BasicCache(db.Model):
         return cls.query.filter(cls.expired == true())
 
     @classmethod
-    def verify(cls, username, password) -> auth0.TokenResult:
+    def prune(cls, batch_size=1000) -> int:
+        """ Delete expired entries with set based DELETEs of at most
+        batch_size rows each, so no single statement holds locks for long.
+        Entries within the stale grace window are kept.
+        Returns: number of deleted entries
+        """
+        pruned = 0
+        grace = timedelta(seconds=env.BASIC_CACHE_STALE_GRACE)
+
+        while True:
+            with db as session:
+                batch = (
+                    session.query(cls.username)
+                    .filter(cls.expires <= datetime.utcnow() - grace)
+                    .limit(batch_size)
+                    .subquery()
+                )
+                deleted = (
+                    session.query(cls)
+                    .filter(cls.username.in_(batch))
+                    .delete(synchronize_session=False)
+                )
+                session.commit()
+            pruned += deleted
+
+            if deleted < batch_size:
+                return pruned
+
+    @classmethod
+    @db.replica()
+    def verify(
+        cls, username, password, max_stale: timedelta = None
+    ) -> auth0.TokenResult:
         """ Clasic username/password verification against hash from db
         Returns: access_token, id_token pair
+
+        Recently verified credentials are answered from a per process memory
+        tier without touching the db or running PBKDF2. With max_stale,
+        entries that expired less than max_stale ago are accepted too.
         """
+        token_result = _remembered_token_result(username, password)
+
+        if token_result:
+            return token_result
+
         cur = cls.query.filter(cls.username == username).one_or_none()
 
         if not cur:
             return None
 
-        if cur.expired:
+        if cur.expired and (
+            max_stale is None or cur.expires + max_stale <= datetime.utcnow()
+        ):
             log.warning("%s expired", cur)
 
             return None
@@ -195,21 +296,27 @@ class BasicCache(db.Model):
         got = _hash(password, cur.salt)
 
         if got == cur.hashed:
-            return auth0.TokenResult(
+            token_result = auth0.TokenResult(
                 cur.access_token, cur.id_token, cur.result
             )
+
+            if not cur.expired:
+                _remember_token_result(username, password, token_result)
+
+            return token_result
         else:
             log.warning("Didnt match %s %s", got, cur.hashed)
 
         return None
 
     @classmethod
-    def create(
+    def store(
         cls, username: str, password: str, token_result: auth0.TokenResult
-    ) -> "BasicCache":
+    ) -> None:
+        """ Store the entry for username, replacing any existing one, with a
+        single INSERT ... ON CONFLICT (username) DO UPDATE """
         salt = os.urandom(32)
-
-        return cls(
+        values = dict(
             username=username,
             salt=salt,
             expires=datetime.utcfromtimestamp(
@@ -220,13 +327,65 @@ class BasicCache(db.Model):
             id_token=token_result.id_token,
             result=token_result.result,
         )
+        upsert = insert(cls.__table__).values(**values)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[cls.username],
+            set_={k: upsert.excluded[k] for k in values if k != "username"},
+        )
+
+        with db as session:
+            session.execute(upsert)
+            session.commit()
+        _remember_token_result(username, password, token_result)
 
 
 def _hash(password, salt):
+    return hashing_executor.run(_pbkdf2, password, salt)
+
+
+def _pbkdf2(password, salt):
     return hashlib.pbkdf2_hmac(
         HASH_ALGO, password.encode(), salt, HASH_ITERATIONS
     )
 
 
 HASH_ALGO = "sha256"  # as recommended by the docs
-HASH_ITERATIONS = 100_000  # ^^
\ No newline at end of file
+HASH_ITERATIONS = 100_000  # ^^
+
+
+def credential_digest(username: str, password: str) -> bytes:
+    """ Keyed digest of a username/password pair. The key is random per
+    process, so the memory tier never holds anything usable outside of it
+    and never the plaintext password """
+
+    return hmac.new(
+        _CREDENTIAL_KEY,
+        b"\0".join((username.encode(), password.encode())),
+        hashlib.sha256,
+    ).digest()
+
+
+def _remembered_token_result(username, password) -> auth0.TokenResult:
+    remembered = _verified_credentials.get(username)
+
+    if remembered is None:
+        return None
+    digest, token_result = remembered
+
+    if hmac.compare_digest(digest, credential_digest(username, password)):
+        return token_result
+
+    return None
+
+
+def _remember_token_result(username, password, token_result) -> None:
+    _verified_credentials.set(
+        username,
+        (credential_digest(username, password), token_result),
+        expires_at=token_result.access_token["exp"],
+    )
+
+
+_CREDENTIAL_KEY = os.urandom(32)
+_verified_credentials = TTLCache(maxsize=env.BASIC_CACHE_MEMORY_SIZE)
+metrics.register("basic_cache_memory", _verified_credentials.stats)
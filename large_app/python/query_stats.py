@@ -0,0 +1,169 @@
+"""Counts SQL statements and database time per request
+
+Every statement run through any engine is recorded by the collectors active
+in the current context: one per request (set up by `init_app`) and any
+`collect_queries()`/`assert_max_queries()` blocks, e.g.
+
+    with assert_max_queries(2):
+        client.get("/api/v1/user")
+
+Requests repeating the same statement QUERY_REPEAT_WARN_THRESHOLD times or
+more are logged as possible N+1 loads. Per endpoint totals are reported as
+"queries" on /metrics.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import env
+import metrics
+
+log = logging.getLogger(__name__)
+
+_collectors = ContextVar("query_collectors", default=())
+
+
+class QueryStats(object):
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds) -> None:
+        self.count += 1
+        self.duration += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold) -> list:
+        """(statement, times) for statements run at least threshold times"""
+
+        return [
+            (statement, times)
+            for statement, times in self.statements.most_common()
+            if times >= threshold
+        ]
+
+
+@contextmanager
+def collect_queries():
+    stats = QueryStats()
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail with AssertionError if the block runs more than limit statements"""
+
+    with collect_queries() as stats:
+        yield stats
+
+    if stats.count > limit:
+        raise AssertionError(
+            f"{stats.count} queries, expected at most {limit}:\n"
+            + "\n".join(
+                f"{times}x {statement}"
+                for statement, times in stats.statements.most_common()
+            )
+        )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, *args):
+    if _collectors.get():
+        conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, *args):
+    started = conn.info.pop("query_started", None)
+
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    for stats in _collectors.get():
+        stats.record(statement, elapsed)
+
+
+class EndpointQueries(object):
+    """Statement counts and database time per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self.db_time = metrics.Timings()
+
+    def observe(self, endpoint, stats, n_plus_one) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(
+                endpoint,
+                {
+                    "requests": 0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "n_plus_one": 0,
+                },
+            )
+            counts["requests"] += 1
+            counts["queries"] += stats.count
+            counts["max_queries"] = max(counts["max_queries"], stats.count)
+            counts["n_plus_one"] += int(n_plus_one)
+        self.db_time[endpoint].observe(stats.duration)
+
+    def stats(self) -> dict:
+        db_time = self.db_time.stats()
+
+        return {
+            endpoint: {**counts, "db": db_time[endpoint]}
+            for endpoint, counts in sorted(self._counts.items())
+        }
+
+
+endpoint_queries = EndpointQueries()
+metrics.register("queries", endpoint_queries.stats)
+
+
+def init_app(app):
+    @app.before_request
+    def start_counting_queries():
+        g.query_stats = QueryStats()
+        g.query_stats_token = _collectors.set(
+            _collectors.get() + (g.query_stats,)
+        )
+
+    @app.teardown_request
+    def report_queries(exc):
+        stats = g.pop("query_stats", None)
+
+        if stats is None:
+            return
+        _collectors.reset(g.pop("query_stats_token"))
+        endpoint = request.endpoint or "unmatched"
+        threshold = env.QUERY_REPEAT_WARN_THRESHOLD
+        repeated = stats.repeated(threshold) if threshold else []
+
+        for statement, times in repeated:
+            log.warning(
+                "Possible N+1 in %s: statement ran %s times: %s",
+                endpoint,
+                times,
+                statement,
+            )
+        endpoint_queries.observe(endpoint, stats, bool(repeated))
+        log.debug(
+            "%s ran %s queries in %.1fms",
+            endpoint,
+            stats.count,
+            stats.duration * 1000,
+        )
@@ -0,0 +1,146 @@
+import json
+import os
+import time
+
+import pytest
+import requests
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql.base import PGCompiler
+from sqlalchemy.dialects.postgresql.dml import OnConflictDoUpdate
+from sqlalchemy.ext.compiler import compiles
+
+import api
+import auth0
+import env
+from http_client import auth0_http, CircuitBreaker
+from models import db
+
+
+@compiles(JSONB, "sqlite")
+def _compile_jsonb_for_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@compiles(OnConflictDoUpdate, "sqlite")
+def _compile_upsert_for_sqlite(on_conflict, compiler, **kw):
+    # sqlite spells ON CONFLICT (...) DO UPDATE the same way as postgres
+    compiler._on_conflict_target = PGCompiler._on_conflict_target.__get__(
+        compiler
+    )
+
+    return PGCompiler.visit_on_conflict_do_update(compiler, on_conflict, **kw)
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """The app against TEST_PGDB_CONNECTION_STRING, or a sqlite file when it
+    is not set. Tables are created from the models"""
+    env.PGDB_CONNECTION_STRING = os.environ.get(
+        "TEST_PGDB_CONNECTION_STRING",
+        f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+        "?check_same_thread=false",
+    )
+    app = api.create_app()
+    app.config["TESTING"] = True
+
+    with app.app_context():
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def token_result():
+    """Auth0 tokens for basic@example.com, valid for an hour"""
+
+    return auth0.TokenResult(
+        access_token={"sub": "auth0|basic", "exp": int(time.time()) + 3600},
+        id_token={"sub": "auth0|basic", "email": "basic@example.com"},
+        result={"token_type": "Bearer", "access_token": "access"},
+    )
+
+
+@pytest.fixture
+def wait_for():
+    """Waits until condition() is true, for threads to reach a point"""
+
+    def wait_for(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+
+        while not condition():
+            assert time.monotonic() < deadline, "timed out waiting"
+            time.sleep(0.001)
+
+    return wait_for
+
+
+class FakeClock(object):
+    """A monotonic clock that only moves when `now` is set"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class FakeSession(object):
+    """Stands in for requests.Session. Answers with the given outcomes in
+    order: a status code, a json body (status 200) or an exception to raise"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    @property
+    def calls(self):
+        return len(self.requests)
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+
+        if isinstance(outcome, Exception):
+            raise outcome
+        res = requests.Response()
+        res.status_code = 200 if isinstance(outcome, dict) else outcome
+        res._content = (
+            json.dumps(outcome).encode() if res.status_code == 200 else b"{}"
+        )
+
+        return res
+
+
+@pytest.fixture
+def fake_session():
+    return FakeSession
+
+
+@pytest.fixture
+def auth0_responses(monkeypatch):
+    """Makes the shared Auth0 client answer with the given outcomes, with a
+    fresh circuit breaker and no backoff"""
+
+    def respond(*outcomes):
+        session = FakeSession(*outcomes)
+        monkeypatch.setattr(auth0_http, "_session", session)
+        monkeypatch.setattr(auth0_http, "_pid", os.getpid())
+        monkeypatch.setattr(auth0_http, "breaker", CircuitBreaker())
+        monkeypatch.setattr(auth0_http, "backoff", 0)
+
+        return session
+
+    return respond
@@ -0,0 +1,83 @@
+import pytest
+
+from models import db
+from models.alerts import AlertType, AlertTypeRegistry
+
+
+@pytest.fixture
+def alert_type(app):
+    with app.app_context():
+        with db as session:
+            alert_type = AlertType(name="Price spike", description="High")
+            session.add(alert_type)
+            session.commit()
+            alert_type_id = alert_type.id
+
+    yield alert_type_id
+
+    with app.app_context():
+        with db as session:
+            session.query(AlertType).delete()
+            session.commit()
+
+
+def test_loads_on_first_get(app, alert_type, clock):
+    registry = AlertTypeRegistry(check_interval=60, clock=clock)
+
+    with app.app_context():
+        assert registry.get(alert_type).name == "Price spike"
+        assert registry.get(alert_type).description == "High"
+
+    assert registry.stats() == {"size": 1, "reloads": 1}
+
+
+def test_failed_refresh_keeps_loaded_types(
+    app, alert_type, clock, monkeypatch
+):
+    registry = AlertTypeRegistry(check_interval=60, clock=clock)
+
+    with app.app_context():
+        registry.get(alert_type)
+
+        def fail():
+            raise RuntimeError("database is down")
+
+        monkeypatch.setattr(registry, "_reload_if_changed", fail)
+        clock.now = 60
+
+        assert registry.get(alert_type).name == "Price spike"
+        assert registry.get(alert_type + 1) is None
+
+    # Not retried before the interval has passed again
+    assert not registry._due()
+
+
+def test_unknown_ids_are_rate_limited(app, alert_type, clock, monkeypatch):
+    registry = AlertTypeRegistry(check_interval=60, clock=clock)
+    checks = []
+    reload_if_changed = registry._reload_if_changed
+
+    def counted():
+        checks.append(clock.now)
+        reload_if_changed()
+
+    monkeypatch.setattr(registry, "_reload_if_changed", counted)
+
+    with app.app_context():
+        for _ in range(100):
+            assert registry.get(alert_type + 1) is None
+
+        # The first get() loads the types, the first miss forces one check
+        assert checks == [0, 0]
+
+        clock.now = 30
+        for _ in range(100):
+            assert registry.get(alert_type + 1) is None
+        assert checks == [0, 0]
+
+        clock.now = 60
+        for _ in range(100):
+            assert registry.get(alert_type + 1) is None
+        assert checks == [0, 0, 60, 60]
+
+    assert registry.stats() == {"size": 1, "reloads": 1}
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import time
+
+import pytest
+import requests
+
+import auth0
+
+
+def test_password_grant_is_not_retried(auth0_responses):
+    session = auth0_responses(503, 200)
+
+    with pytest.raises(requests.HTTPError):
+        auth0.token_from_username_password("user@example.com", "secret")
+
+    assert session.calls == 1
+
+
+class StopRefreshing(Exception):
+    pass
+
+
+def management_token(lifetime, issued_ago=0) -> auth0.TokenResult:
+    issued = time.time() - issued_ago
+
+    return auth0.TokenResult(
+        access_token={"iat": issued, "exp": issued + lifetime},
+        id_token={},
+        result={
+            "token_type": "Bearer",
+            "access_token": f"token-{issued}",
+            "expires_in": lifetime,
+        },
+    )
+
+
+@pytest.fixture
+def management_api():
+    return auth0.ManagementAPI(
+        renew_window=timedelta(seconds=300), background_refresh=False
+    )
+
+
+def test_short_lived_token_is_not_renewed_right_away(management_api):
+    assert not management_api._needs_renewal(management_token(60))
+    assert not management_api._needs_renewal(management_token(60, 29))
+    assert management_api._needs_renewal(management_token(60, 31))
+    assert management_api._needs_renewal(management_token(3600, 3301))
+    assert not management_api._needs_renewal(management_token(3600, 3299))
+
+
+def test_refresher_sleeps_for_half_a_short_lifetime(
+    management_api, monkeypatch
+):
+    renewals = []
+    sleeps = []
+
+    def renew():
+        renewals.append(1)
+        management_api._current_access_token = management_token(60)
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+
+        if len(sleeps) == 2:
+            raise StopRefreshing()
+
+    monkeypatch.setattr(management_api, "_renew", renew)
+    monkeypatch.setattr(auth0.time, "sleep", sleep)
+
+    with pytest.raises(StopRefreshing):
+        management_api._refresh_forever()
+
+    # Renewed once, then slept until half the lifetime was left
+    assert renewals == [1]
+    assert all(29 <= seconds <= 30 for seconds in sleeps)
+
+
+@pytest.mark.parametrize("issued_ago", [3400, 3700])
+def test_renewal_is_single_flight(management_api, monkeypatch, issued_ago):
+    """Near expiry one caller renews while the others keep the old token;
+    once expired the others wait for the renewal"""
+    old = management_token(3600, issued_ago)
+    new = management_token(3600)
+    management_api._current_access_token = old
+    renewing = threading.Event()
+    release = threading.Event()
+    renewals = []
+
+    def renew():
+        renewals.append(1)
+        renewing.set()
+        release.wait(5)
+        management_api._current_access_token = new
+
+    monkeypatch.setattr(management_api, "_renew", renew)
+
+    with ThreadPoolExecutor(8) as pool:
+        first = pool.submit(management_api._access_token)
+        renewing.wait(5)
+        others = [pool.submit(management_api._access_token) for _ in range(7)]
+
+        if not old.is_expired():
+            assert all(other.result(5) is old for other in others)
+        release.set()
+        others = [other.result(5) for other in others]
+
+    assert renewals == [1]
+    assert first.result() is new
+    assert all(token is (new if old.is_expired() else old) for token in others)
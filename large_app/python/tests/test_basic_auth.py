@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from api.auth import basic_auth
+import auth0
+import env
+from http_client import auth0_http
+from models import Auth0Mapping, BasicCache, db, User
+from models import user as user_models
+from query_stats import collect_queries
+
+
+@pytest.fixture(autouse=True)
+def clean(app):
+    user_models._verified_credentials.clear()
+    basic_auth._stale_refreshes.clear()
+
+    yield
+
+    user_models._verified_credentials.clear()
+    with app.app_context():
+        with db as session:
+            session.query(BasicCache).delete()
+            session.commit()
+
+
+def test_concurrent_logins_share_one_grant(
+    app, token_result, monkeypatch, wait_for
+):
+    release = threading.Event()
+    grants = []
+
+    def grant(username, password):
+        grants.append(username)
+        release.wait(5)
+
+        return token_result
+
+    monkeypatch.setattr(auth0, "token_from_username_password", grant)
+    coalesced = basic_auth._password_grants.coalesced
+
+    def login(_):
+        with app.app_context():
+            return basic_auth._token_result("basic@example.com", "secret")
+
+    with ThreadPoolExecutor(4) as pool:
+        logins = [pool.submit(login, i) for i in range(4)]
+        wait_for(
+            lambda: basic_auth._password_grants.coalesced - coalesced == 3
+        )
+        release.set()
+        results = [result.result(5) for result in logins]
+
+    assert grants == ["basic@example.com"]
+    assert all(result == token_result for result in results)
+
+
+def test_expired_entry_is_served_while_circuit_is_open(
+    app, token_result, monkeypatch, auth0_responses
+):
+    monkeypatch.setattr(env, "BASIC_CACHE_STALE_GRACE", 3600)
+    expired = auth0.TokenResult(
+        access_token={**token_result.access_token, "exp": time.time() - 60},
+        id_token=token_result.id_token,
+        result=token_result.result,
+    )
+    refreshes = []
+    monkeypatch.setattr(
+        basic_auth,
+        "_refresh_in_background",
+        lambda username, password: refreshes.append(username),
+    )
+    auth0_responses()
+    for _ in range(auth0_http.breaker.failure_threshold):
+        auth0_http.breaker.record_failure()
+    served = basic_auth._stale_stats["served"]
+
+    with app.app_context():
+        BasicCache.store("basic@example.com", "secret", expired)
+
+        assert (
+            basic_auth._token_result("basic@example.com", "secret") == expired
+        )
+        with pytest.raises(auth0.AuthError) as unavailable:
+            basic_auth._token_result("basic@example.com", "wrong")
+
+    assert unavailable.value.status_code == 503
+    assert basic_auth._stale_stats["served"] == served + 1
+    assert refreshes == ["basic@example.com"]
+
+
+@pytest.fixture
+def mapping(app):
+    basic_auth._applied_user_info.clear()
+
+    with app.app_context():
+        with db as session:
+            user = User(name="Refresh", email="refresh@example.com")
+            session.add(user)
+            session.flush()
+            session.add(Auth0Mapping(user_id=user.id, sub="auth0|refresh"))
+            session.commit()
+
+        mapping = Auth0Mapping.get_from_sub("auth0|refresh")
+        mapping.user
+
+        yield mapping
+
+        with db as session:
+            session.query(Auth0Mapping).delete()
+            session.query(User).delete()
+            session.commit()
+
+
+def test_unchanged_user_info_is_not_written_again(mapping):
+    id_token = {
+        "sub": "auth0|refresh",
+        "name": "Refresh",
+        "email": "refresh@example.com",
+    }
+    skipped = basic_auth._refresh_stats["skipped"]
+
+    with collect_queries() as queries:
+        basic_auth.update_user_from_token(mapping, id_token)
+        basic_auth.update_user_from_token(mapping, id_token)
+
+    assert queries.count == 0
+    assert basic_auth._refresh_stats["skipped"] == skipped + 1
+
+    # Writing the user through the ORM forgets what was applied
+    user_id = mapping.user_id
+    assert basic_auth._applied_user_info.get(user_id)
+    with db as session:
+        session.query(User).get(user_id).phone = "12345678"
+        session.commit()
+    assert basic_auth._applied_user_info.get(user_id) is None
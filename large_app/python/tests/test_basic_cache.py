@@ -0,0 +1,66 @@
+import pytest
+
+import auth0
+from models import BasicCache, db
+from models import user as user_models
+from query_stats import collect_queries
+
+
+@pytest.fixture(autouse=True)
+def basic_cache(app):
+    user_models._verified_credentials.clear()
+
+    with app.app_context():
+        yield
+
+        user_models._verified_credentials.clear()
+        with db as session:
+            session.query(BasicCache).delete()
+            session.commit()
+
+
+def test_memory_tier_skips_db_and_hashing(token_result, monkeypatch):
+    BasicCache.store("basic@example.com", "secret", token_result)
+
+    def no_hashing(*args):
+        raise AssertionError("hashed a remembered password")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(user_models.hashing_executor, "run", no_hashing)
+
+        with collect_queries() as queries:
+            remembered = BasicCache.verify("basic@example.com", "secret")
+
+    assert remembered == token_result
+    assert queries.count == 0
+
+    # A wrong password is never answered from memory
+    with collect_queries() as queries:
+        assert BasicCache.verify("basic@example.com", "wrong") is None
+    assert queries.count == 1
+
+
+def test_db_hit_is_remembered(token_result):
+    BasicCache.store("basic@example.com", "secret", token_result)
+    user_models._verified_credentials.clear()
+
+    with collect_queries() as queries:
+        assert BasicCache.verify("basic@example.com", "secret") == token_result
+        assert BasicCache.verify("basic@example.com", "secret") == token_result
+
+    assert queries.count == 1
+
+
+def test_store_replaces_existing_entry(token_result):
+    BasicCache.store("basic@example.com", "old", token_result)
+    renewed = auth0.TokenResult(
+        access_token={**token_result.access_token, "exp": 4102444800},
+        id_token=token_result.id_token,
+        result={**token_result.result, "access_token": "renewed"},
+    )
+    BasicCache.store("basic@example.com", "new", renewed)
+    user_models._verified_credentials.clear()
+
+    assert BasicCache.query.count() == 1
+    assert BasicCache.verify("basic@example.com", "old") is None
+    assert BasicCache.verify("basic@example.com", "new") == renewed
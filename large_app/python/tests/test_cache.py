@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+from cache import SingleFlight
+
+
+def test_single_flight_shares_one_call(wait_for):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+
+        return object()
+
+    with ThreadPoolExecutor(8) as pool:
+        leader = pool.submit(flight.do, "key", slow)
+
+        wait_for(lambda: calls)
+        followers = [pool.submit(flight.do, "key", slow) for _ in range(7)]
+
+        wait_for(lambda: flight.coalesced == 7)
+        release.set()
+        results = [leader.result(5)] + [f.result(5) for f in followers]
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+
+    # Finished calls are forgotten, the next one runs again
+    flight.do("key", lambda: calls.append(2))
+    assert calls == [1, 2]
+
+
+def test_single_flight_shares_the_error(wait_for):
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+
+        raise ValueError("grant failed")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "key", failing)
+
+        wait_for(lambda: flight._calls)
+        follower = pool.submit(flight.do, "key", failing)
+
+        wait_for(lambda: flight.coalesced)
+        release.set()
+
+        for call in (leader, follower):
+            with pytest.raises(ValueError):
+                call.result(5)
@@ -0,0 +1,84 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from flask import Flask
+import pytest
+from sqlalchemy import event
+
+import models.database
+import user_module.models.database
+
+THREADS = 32
+ROUNDS = 20
+
+
+@pytest.fixture(params=["models", "user_module"])
+def app_db(request, app, tmp_path):
+    if request.param == "models":
+        return app, models.database.db
+
+    user_app = Flask(__name__)
+    user_app.config.update(
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'user.db'}"
+            "?check_same_thread=false",
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        }
+    )
+    db = user_module.models.database.db
+    db.init_app(user_app)
+
+    return user_app, db
+
+
+def test_nested_sessions_from_many_threads(app_db):
+    app, db = app_db
+    barrier = threading.Barrier(THREADS, timeout=30)
+    # Connections held per thread
+    held = defaultdict(int)
+
+    def checked_out(*args):
+        held[threading.get_ident()] += 1
+
+    def checked_in(*args):
+        held[threading.get_ident()] -= 1
+
+    def work(_):
+        with app.app_context():
+            seen = []
+
+            for i in range(ROUNDS):
+                with db as outer:
+                    if i == 0:
+                        barrier.wait()
+
+                    with db as inner:
+                        assert inner is outer
+                        assert db.session is outer
+                        assert inner.execute("SELECT 1").scalar() == 1
+
+                    assert db.session is outer
+                    seen.append(outer)
+
+                # Leaving the outermost block gives the connection back
+                assert held[threading.get_ident()] == 0
+                with pytest.raises(RuntimeError, match="Use in context"):
+                    db.session
+
+            return seen[0]
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "checkout", checked_out)
+    event.listen(engine, "checkin", checked_in)
+    try:
+        with ThreadPoolExecutor(THREADS) as pool:
+            sessions = list(pool.map(work, range(THREADS)))
+    finally:
+        event.remove(engine, "checkout", checked_out)
+        event.remove(engine, "checkin", checked_in)
+
+    # All threads were inside a block at once, each with its own session
+    assert len({id(session) for session in sessions}) == THREADS
+    assert held and not any(held.values())
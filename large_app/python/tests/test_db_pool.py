@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+import db_pool
+import env
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    monkeypatch.setattr(env, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(env, "DB_POOL_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(env, "DB_POOL_TIMEOUT", 0.05)
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        **db_pool.engine_options("test_pool"),
+    )
+
+    yield engine
+
+    engine.dispose()
+    db_pool._pools.pop("test_pool", None)
+
+
+def test_pool_gauges(engine):
+    first = engine.connect()
+    second = engine.connect()
+    stats = db_pool.stats()["test_pool"]
+
+    assert stats["size"] == 1
+    assert stats["checked_out"] == 2
+    assert stats["overflow"] == 1
+    assert stats["overflows"] == 1
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    assert db_pool.stats()["test_pool"]["checkout_wait"]["errors"] == 1
+
+    first.close()
+    second.close()
+    stats = db_pool.stats()["test_pool"]
+    assert stats["checked_out"] == 0
+    assert stats["checkout_wait"]["count"] == 3
+
+
+def test_counters_survive_dispose(engine):
+    engine.connect().close()
+    held = [engine.connect(), engine.connect()]
+    for connection in held:
+        connection.close()
+    engine.dispose()
+
+    # The new pool carries on counting from the old one
+    stats = db_pool.stats()["test_pool"]
+    assert stats["checked_out"] == 0
+    assert stats["overflows"] == 1
+    assert stats["checkout_wait"]["count"] == 3
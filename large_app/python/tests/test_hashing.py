@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+import auth0
+from models.hashing import HashingExecutor
+
+
+def test_rejects_with_503_when_saturated():
+    hashing = HashingExecutor(workers=1, queue_limit=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(5)
+
+        return "hashed"
+
+    with ThreadPoolExecutor(2) as callers:
+        running = callers.submit(hashing.run, blocked)
+        started.wait(5)
+        queued = callers.submit(hashing.run, lambda: "queued")
+
+        while hashing.in_flight < 2:
+            time.sleep(0.001)
+
+        with pytest.raises(auth0.AuthError) as rejected:
+            hashing.run(lambda: "rejected")
+        assert rejected.value.status_code == 503
+        assert hashing.stats()["queue_depth"] == 1
+
+        release.set()
+        assert running.result(5) == "hashed"
+        assert queued.result(5) == "queued"
+
+    assert hashing.rejected == 1
+    assert hashing.run(lambda: "again") == "again"
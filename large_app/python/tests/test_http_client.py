@@ -0,0 +1,146 @@
+import os
+
+import pytest
+import requests
+
+from http_client import CircuitBreaker, CircuitOpenError, HTTPClient
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+
+
+@pytest.fixture
+def client_with(fake_session):
+    def client_with(breaker, *outcomes):
+        client = HTTPClient(retries=0, breaker=breaker)
+        client._session = fake_session(*outcomes)
+        client._pid = os.getpid()
+
+        return client
+
+    return client_with
+
+
+def test_opens_after_threshold(breaker):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 1
+
+
+def test_half_open_lets_one_trial_through(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now = 30
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 30
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now = 60
+    breaker.before_call()
+
+
+def test_unexpected_error_settles_trial(breaker, clock, client_with):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 30
+    client = client_with(
+        breaker, requests.exceptions.ChunkedEncodingError(), 200
+    )
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get("https://auth0.invalid/userinfo")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 60
+    assert client.get("https://auth0.invalid/userinfo").status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_server_errors_count_as_failures(breaker, client_with):
+    client = client_with(breaker, 503, 502, requests.Timeout())
+
+    client.get("https://auth0.invalid/userinfo")
+    client.get("https://auth0.invalid/userinfo")
+    with pytest.raises(requests.Timeout):
+        client.get("https://auth0.invalid/userinfo")
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get("https://auth0.invalid/userinfo")
+    assert client._session.calls == 3
+
+
+def test_rate_limits_do_not_open_circuit(breaker, client_with):
+    client = client_with(breaker, 429, 429, 429, 200)
+
+    for _ in range(4):
+        client.get("https://auth0.invalid/userinfo")
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_results_of_an_older_generation_are_ignored(breaker, clock):
+    slow = breaker.before_call()
+
+    for _ in range(3):
+        breaker.record_failure(breaker.before_call())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Started before the circuit opened, finishing afterwards
+    breaker.record_success(slow)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 30
+    trial = breaker.before_call()
+    breaker.record_success(slow)
+    breaker.record_failure(slow)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success(trial)
+    assert breaker.state == CircuitBreaker.CLOSED
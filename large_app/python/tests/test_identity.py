@@ -0,0 +1,58 @@
+import pytest
+
+from api.auth import identity
+from models import Auth0Mapping, db, User
+from query_stats import collect_queries
+
+
+@pytest.fixture
+def mapped_user(app):
+    identity._identities.clear()
+    identity._subs.clear()
+
+    with app.app_context():
+        with db as session:
+            user = User(name="Before", email="identity@example.com")
+            session.add(user)
+            session.flush()
+            session.add(Auth0Mapping(user_id=user.id, sub="auth0|identity"))
+            session.commit()
+            user_id = user.id
+
+        yield user_id
+
+        with db as session:
+            session.query(Auth0Mapping).delete()
+            session.query(User).delete()
+            session.commit()
+
+
+def test_identity_is_cached_until_the_user_is_written(mapped_user):
+    with collect_queries() as queries:
+        first = identity.identity_for_sub("auth0|identity")
+        assert identity.identity_for_sub("auth0|identity") is first
+    assert queries.count == 1
+    assert (first.id, first.name) == (mapped_user, "Before")
+
+    with db as session:
+        session.query(User).get(mapped_user).name = "After"
+        session.commit()
+
+    with collect_queries() as queries:
+        assert identity.identity_for_sub("auth0|identity").name == "After"
+    assert queries.count == 1
+
+
+def test_invalidate_user_drops_the_identity(mapped_user):
+    identity.identity_for_sub("auth0|identity")
+    identity.invalidate_user(mapped_user)
+
+    with collect_queries() as queries:
+        identity.identity_for_sub("auth0|identity")
+    assert queries.count == 1
+
+
+def test_unknown_sub_is_not_cached(app):
+    with app.app_context():
+        assert identity.identity_for_sub("auth0|nobody") is None
+    assert identity._identities.get("auth0|nobody") is None
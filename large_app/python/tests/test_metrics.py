@@ -0,0 +1,55 @@
+import threading
+
+from flask import request
+
+import env
+import metrics
+
+
+def test_counters_from_many_threads():
+    counters = metrics.Counters("hits")
+
+    def hit():
+        for _ in range(1000):
+            counters.incr("hits")
+
+    threads = [threading.Thread(target=hit) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counters.stats() == {"hits": 16000}
+    assert counters["misses"] == 0
+
+
+def test_metrics_only_from_loopback_without_token(app, client):
+    for remote_addr, authorized in [
+        ("127.0.0.1", True),
+        ("::1", True),
+        ("10.0.0.1", False),
+    ]:
+        with app.test_request_context(
+            "/metrics", environ_base={"REMOTE_ADDR": remote_addr}
+        ):
+            assert metrics.authorized(request) is authorized
+
+    assert client.get("/metrics").status_code == 403
+
+
+def test_metrics_with_token(client, monkeypatch):
+    monkeypatch.setattr(env, "METRICS_TOKEN", "s3cret")
+
+    assert client.get("/metrics").status_code == 403
+    assert (
+        client.get(
+            "/metrics", headers={"Authorization": "Bearer wrong"}
+        ).status_code
+        == 403
+    )
+    res = client.get(
+        "/metrics",
+        headers={"Authorization": "Bearer s3cret"},
+    )
+    assert res.status_code == 200
+    assert "auth0_http" in res.json
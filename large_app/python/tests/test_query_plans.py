@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+from api.query_plans import check_query_plans
+
+pytestmark = pytest.mark.skipif(
+    "TEST_PGDB_CONNECTION_STRING" not in os.environ,
+    reason="query plans need postgres (TEST_PGDB_CONNECTION_STRING)",
+)
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        assert check_query_plans() == {}
@@ -0,0 +1,91 @@
+import logging
+from types import SimpleNamespace
+
+from flask import Flask
+import pytest
+from sqlalchemy import create_engine
+
+import api.auth
+from api.auth.identity import UserIdentity
+import env
+from models import db, User
+from models.alerts import AlertSubscription, AlertType
+from models.user import UserLocation
+import query_stats
+from query_stats import assert_max_queries
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        with db as session:
+            alert_types = [AlertType(name=f"type {i}") for i in range(3)]
+            user = User(name="Budget", email="budget@example.com")
+            user.locations = [
+                UserLocation(name=f"home {i}", country="NO") for i in range(3)
+            ]
+            session.add_all([user, *alert_types])
+            session.flush()
+            user.alert_subscriptions = [
+                AlertSubscription(alert_type_id=alert_type.id)
+                for alert_type in alert_types
+            ]
+            session.commit()
+            identity = UserIdentity.from_user(user)
+
+    yield identity
+
+    with app.app_context():
+        with db as session:
+            session.query(AlertSubscription).delete()
+            session.query(UserLocation).delete()
+            session.query(User).delete()
+            session.query(AlertType).delete()
+            session.commit()
+
+
+@pytest.fixture
+def logged_in(monkeypatch, user):
+    monkeypatch.setitem(
+        api.auth.authenticators,
+        "bearer",
+        lambda req: SimpleNamespace(user=user),
+    )
+
+    return {"Authorization": "Bearer test"}
+
+
+def test_get_user_query_budget(client, logged_in):
+    # The first request warms the alert type registry
+    assert client.get("/api/v1/user", headers=logged_in).status_code == 200
+
+    # The user, then one select per collection
+    with assert_max_queries(3):
+        res = client.get("/api/v1/user", headers=logged_in)
+
+    assert res.status_code == 200
+    assert len(res.json["locations"]) == 3
+    assert sorted(alert["name"] for alert in res.json["alerts"]) == [
+        "type 0",
+        "type 1",
+        "type 2",
+    ]
+
+
+def test_repeated_statement_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(env, "QUERY_REPEAT_WARN_THRESHOLD", 5)
+    engine = create_engine("sqlite://")
+    app = Flask(__name__)
+    query_stats.init_app(app)
+
+    @app.route("/n-plus-one")
+    def n_plus_one():
+        for i in range(5):
+            engine.execute("SELECT ?", i)
+
+        return "OK"
+
+    with caplog.at_level(logging.WARNING, logger="query_stats"):
+        assert app.test_client().get("/n-plus-one").status_code == 200
+
+    assert "Possible N+1 in n_plus_one: statement ran 5 times" in caplog.text
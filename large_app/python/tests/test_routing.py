@@ -0,0 +1,101 @@
+from flask import Flask, jsonify
+import pytest
+from sqlalchemy import column, create_engine, table, text
+
+from api.export import users
+import env
+import metrics
+from models.database import RoutingSQLAlchemy
+
+SOURCE = text("SELECT source FROM marker")
+
+
+@pytest.fixture
+def routing(monkeypatch, tmp_path):
+    """An app with a primary and one replica, each sqlite file telling
+    which one it is"""
+    urls = {}
+
+    for source in ("primary", "replica"):
+        urls[source] = f"sqlite:///{tmp_path / source}.db"
+        engine = create_engine(urls[source])
+        engine.execute("CREATE TABLE marker (source TEXT)")
+        engine.execute("INSERT INTO marker VALUES (?)", source)
+        engine.dispose()
+
+    monkeypatch.setattr(
+        env, "PGDB_REPLICA_CONNECTION_STRINGS", [urls["replica"]]
+    )
+    monkeypatch.setattr(env, "PGDB_REPLICA_MAX_LAG", 0)
+    monkeypatch.setattr(metrics, "_providers", dict(metrics._providers))
+    db = RoutingSQLAlchemy()
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "SQLALCHEMY_DATABASE_URI": urls["primary"],
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        }
+    )
+    db.init_app(app)
+
+    @app.route("/source", methods=["GET", "POST"])
+    def source():
+        return jsonify(db.session.execute(SOURCE).scalar())
+
+    return app, db
+
+
+def test_reads_in_replica_blocks_go_to_the_replica(routing):
+    app, db = routing
+
+    with app.app_context():
+        assert db.session.execute(SOURCE).scalar() == "primary"
+
+        with db.replica():
+            assert db.session.execute(SOURCE).scalar() == "replica"
+
+    assert db.routing_stats["replica"] == 1
+
+
+def test_use_primary_keeps_reads_on_the_primary(routing):
+    app, db = routing
+
+    with app.app_context():
+        db.use_primary()
+
+        with db.replica():
+            assert db.session.execute(SOURCE).scalar() == "primary"
+
+
+def test_writes_pin_the_session_to_the_primary(routing):
+    app, db = routing
+    marker = table("marker", column("source"))
+
+    with app.app_context():
+        with db.replica():
+            db.session.execute(marker.update().values(source="written"))
+            assert db.session.execute(SOURCE).scalar() == "written"
+        db.session.commit()
+
+        # Still pinned for the rest of the session, and the replica was
+        # never written to
+        with db.replica():
+            assert db.session.execute(SOURCE).scalar() == "written"
+        replica = db.get_engine(app, bind="replica_0")
+        assert replica.execute(SOURCE).scalar() == "replica"
+
+
+def test_get_requests_read_from_the_replica(routing):
+    app, db = routing
+    client = app.test_client()
+
+    assert client.get("/source").json == "replica"
+    assert client.post("/source").json == "primary"
+
+
+def test_export_reads_from_the_replica(routing, monkeypatch):
+    app, db = routing
+    monkeypatch.setattr(users, "db", db)
+
+    with app.app_context():
+        assert list(users.export_rows(SOURCE, 10)) == [[("replica",)]]
@@ -0,0 +1,5 @@
+from models.schemas import UserSchema
+
+
+def test_user_schema_hides_normalized_email():
+    assert "email_normalized" not in UserSchema().fields
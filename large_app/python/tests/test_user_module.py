@@ -0,0 +1,83 @@
+import pytest
+
+import env
+import user_module
+from user_module.models import db, User
+
+
+@pytest.fixture(scope="module")
+def user_app(tmp_path_factory):
+    app = user_module.create_app()
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=(
+            f"sqlite:///{tmp_path_factory.mktemp('db') / 'user_module.db'}"
+            "?check_same_thread=false"
+        ),
+    )
+
+    with app.app_context():
+        db.create_all()
+
+        with db as session:
+            session.add_all(
+                User(name=f"User {i}", email=f"user{i}@example.com")
+                for i in range(5)
+            )
+            session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def user_client(user_app):
+    return user_app.test_client()
+
+
+def test_pages_follow_next_cursor(user_client):
+    emails = []
+    query = {"limit": 2}
+
+    while True:
+        res = user_client.get("/api/v1/user", query_string=query)
+        assert res.status_code == 200
+        emails += [user["email"] for user in res.json["items"]]
+
+        if res.json["next_cursor"] is None:
+            break
+        query["after"] = res.json["next_cursor"]
+
+    assert emails == [f"user{i}@example.com" for i in range(5)]
+
+
+def test_last_page_has_no_next_cursor(user_client):
+    res = user_client.get("/api/v1/user?limit=5")
+
+    assert len(res.json["items"]) == 5
+    assert res.json["next_cursor"] is None
+
+
+def test_limit_is_capped(user_client, monkeypatch):
+    monkeypatch.setattr(env, "USER_PAGE_SIZE_MAX", 3)
+    res = user_client.get("/api/v1/user?limit=100")
+
+    assert len(res.json["items"]) == 3
+    assert res.json["next_cursor"] == res.json["items"][-1]["id"]
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_limit_below_one_is_rejected(user_client, limit):
+    assert user_client.get(f"/api/v1/user?limit={limit}").status_code == 422
+
+
+def test_get_by_id(user_client):
+    user_id = user_client.get("/api/v1/user").json["items"][0]["id"]
+
+    res = user_client.get(f"/api/v1/user/{user_id}")
+    assert res.status_code == 200
+    assert res.json["email"] == "user0@example.com"
+
+    assert user_client.get("/api/v1/user/999999").status_code == 404
@@ -1,10 +1,13 @@
 from apispec import APISpec
 from apispec.ext.marshmallow import MarshmallowPlugin
-from flask import Flask, jsonify
+from flask import abort, Flask, jsonify, request
 from flask_migrate import Migrate, MigrateCommand
 
+import db_pool
 import env
 import loggers
+import metrics
+import query_stats
 from user_module.models import db, docs, marshmallow
 from . import user
 from .swaggerui import API_URL, SWAGGER_URL, swaggerui_blueprint
@@ -35,10 +38,12 @@ spec = APISpec(
 def create_app():
     app = Flask(__name__)
     loggers.init_app(app)
+    query_stats.init_app(app)
     app.config.update(
         {
             "SQLALCHEMY_DATABASE_URI": env.PGDB_CONNECTION_STRING,
             "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            "SQLALCHEMY_ENGINE_OPTIONS": db_pool.engine_options(),
             "APISPEC_SPEC": spec,
             "APISPEC_SWAGGER_UI_URL": None,
             "APISPEC_SWAGGER_URL": API_URL,
@@ -72,6 +77,13 @@ def create_app():
     def version():
         return jsonify(version=env.VERSION, api_version=current_version)
 
+    @app.route("/metrics")
+    def process_metrics():
+        if not metrics.authorized(request):
+            abort(403)
+
+        return jsonify(metrics.snapshot())
+
     docs.init_app(app)
 
     return app
@@ -0,0 +1,64 @@
+"""add user.email_normalized with a unique index
+
+Revision ID: d2a7c4e1b9f6
+Revises: 0add8bfcaa01
+Create Date: 2026-10-18 15:21:08.604512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c4e1b9f6'
+down_revision = '0add8bfcaa01'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    # Nullable and without default, so adding it doesn't rewrite the table
+    op.add_column(
+        'user', sa.Column('email_normalized', sa.Text(), nullable=True)
+    )
+
+    with op.get_context().autocommit_block():
+        # Backfilled in batches, each committed on its own, so no single
+        # statement locks a large part of the user table. Users written in
+        # the meantime by the new code already have the column set.
+        bind = op.get_bind()
+
+        while True:
+            updated = bind.execute(
+                sa.text(
+                    'UPDATE "user" SET email_normalized = lower(email) '
+                    'WHERE id IN (SELECT id FROM "user" '
+                    'WHERE email_normalized IS NULL LIMIT :batch_size)'
+                ),
+                batch_size=BATCH_SIZE,
+            ).rowcount
+
+            if updated < BATCH_SIZE:
+                break
+
+        # Fails, leaving an INVALID index to drop, if emails that only
+        # differ in case exist. Those users have to be merged first.
+        op.create_index(
+            op.f('ix_user_email_normalized'),
+            'user',
+            ['email_normalized'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f('ix_user_email_normalized'),
+            table_name='user',
+            postgresql_concurrently=True,
+        )
+    op.drop_column('user', 'email_normalized')
@@ -1,11 +1,25 @@
+from contextvars import ContextVar
+
 from flask_sqlalchemy import SQLAlchemy
 
 
 class Wrapper(object):
+    """`with db as session:` hands out the session of the current
+    thread/greenlet, closing it when the outermost block exits. The session
+    and nesting depth live in a ContextVar so concurrent requests never see
+    each other's state."""
+
     def __init__(self, sqlalchemy):
         self._db = sqlalchemy
-        self._session = None
-        self._nesting = 0
+        self._state = ContextVar(f"db_session_{id(self)}", default=(None, 0))
+
+    @property
+    def _session(self):
+        return self._state.get()[0]
+
+    @property
+    def _nesting(self):
+        return self._state.get()[1]
 
     @property
     def session(self):
@@ -20,22 +34,24 @@ class Wrapper(object):
         self._db.session = new_session
 
     def __enter__(self):
-        if self._session is None:
-            assert self._nesting == 0
-            self._session = self._db.session()
-        self._nesting += 1
+        session, nesting = self._state.get()
 
-        return self._session
+        if session is None:
+            assert nesting == 0
+            session = self._db.session()
+        self._state.set((session, nesting + 1))
+
+        return session
 
     def __exit__(self, type, value, _):
-        self._nesting -= 1
-        dirty = bool(
-            self._session.new or self._session.dirty or self._session.deleted
-        )
-
-        if self._nesting == 0:
-            self._session.close()
-            self._session = None
+        session, nesting = self._state.get()
+        nesting -= 1
+        dirty = bool(session.new or session.dirty or session.deleted)
+
+        if nesting == 0:
+            session.close()
+            session = None
+        self._state.set((session, nesting))
 
         if value is None and dirty:
             raise RuntimeError("Dirty session!")
@@ -1,4 +1,7 @@
+from marshmallow import validate
 from marshmallow_sqlalchemy import TableSchema
+
+import env
 from .marshmallow import marshmallow as ma
 from .user import User, UserLocation
 
@@ -6,7 +9,7 @@ from .user import User, UserLocation
 class UserSchema(TableSchema):
     class Meta:
         table = User.__table__
-        exclude = ("deleted", "created", "updated")
+        exclude = ("deleted", "created", "updated", "email_normalized")
         strict = True
 
         email = ma.Email(required=True)
@@ -16,6 +19,30 @@ class UserSchema(TableSchema):
 User.schema = UserSchema()
 
 
+class UserPageArgsSchema(ma.Schema):
+    limit = ma.Integer(
+        missing=env.USER_PAGE_SIZE,
+        validate=validate.Range(min=1),
+        description=f"Page size, at most {env.USER_PAGE_SIZE_MAX}",
+    )
+    after = ma.Integer(
+        missing=None, description="next_cursor of the previous page"
+    )
+    with_total = ma.Boolean(
+        missing=False, description="Include total_estimate"
+    )
+
+
+class UserPageSchema(ma.Schema):
+    items = ma.Nested(UserSchema, many=True)
+    next_cursor = ma.Integer(
+        allow_none=True, description="after for the next page, null if last"
+    )
+    total_estimate = ma.Integer(
+        allow_none=True, description="Approximate number of users"
+    )
+
+
 class TokenResultSchema(ma.Schema):
     token_type = ma.String()
     access_token = ma.String()
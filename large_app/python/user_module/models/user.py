@@ -9,7 +9,8 @@ from sqlalchemy import Boolean, DateTime, Text, CHAR
 from dataclasses import dataclass
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.sql.expression import true
+from sqlalchemy.orm import lazyload, validates
+from sqlalchemy.sql.expression import text, true
 
 from .database import db
 
@@ -66,22 +67,67 @@ class User(StandardObjectMixin, UserMixin, db.Model):
     name = db.Column(Text, nullable=False)
     phone = db.Column(Text)
     email = db.Column(Text, unique=True, nullable=False)
+    # lower(email), kept in sync by _normalize_email, for indexed
+    # case-insensitive lookups
+    email_normalized = db.Column(Text, unique=True, index=True)
     locale = db.Column(Text)
     terms_accept = db.Column(Boolean)
     terms_accept_at = db.Column(DateTime)
     locations = db.relationship(UserLocation, lazy="joined")
 
+    @validates("email")
+    def _normalize_email(self, key, email):
+        self.email_normalized = normalize_email(email)
+
+        return email
+
     def exists(self):
         return (
-                self.query.filter(
-                    db.func.lower(User.email) == db.func.lower(self.email)
-                ).first()
-                is not None
+            self.query.filter(
+                User.email_normalized == normalize_email(self.email)
+            ).first()
+            is not None
         )
 
     def dump(self):  # pragma: no cover
         return self.schema.dump(self).data
 
+    @classmethod
+    def page(cls, after=None, limit=50) -> list:
+        """ Up to limit users ordered by id, starting after the id `after`.
+        Keyset pagination: the cost doesn't grow with how far in we are """
+        query = cls.query.options(lazyload(cls.locations)).order_by(cls.id)
+
+        if after is not None:
+            query = query.filter(cls.id > after)
+
+        return query.limit(limit).all()
+
+    @classmethod
+    def get_by_id(cls, user_id) -> "User":
+        return cls.query.options(lazyload(cls.locations)).get(user_id)
+
+    @classmethod
+    def estimated_count(cls) -> int:
+        """ The planner's row estimate from pg_class, as of the last
+        ANALYZE. None if the table was never analyzed """
+        # On the session page() used, rather than one of its own
+        estimate = cls.query.session.execute(
+            text(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = CAST(:table AS regclass)"
+            ),
+            {"table": f'"{cls.__tablename__}"'},
+        ).scalar()
+
+        return estimate if estimate is not None and estimate >= 0 else None
+
+
+def normalize_email(email: str) -> str:
+    """ The form emails are compared in: case-insensitive """
+
+    return email.lower() if email is not None else None
+
 
 class BasicCache(db.Model):
     """Caching of basic credentials
@@ -1,10 +1,16 @@
-from flask import request
+from flask import abort, request
 from flask_apispec import marshal_with, MethodResource, use_kwargs
 from flask_login import current_user, login_required
 
 # from auth0 import AuthError, management_api
+import env
 from user_module.models import db, User
-from user_module.models.schemas import UserSchema, IdResultSchema
+from user_module.models.schemas import (
+    IdResultSchema,
+    UserPageArgsSchema,
+    UserPageSchema,
+    UserSchema,
+)
 from ..spec import docer, not_implemented
 
 
@@ -13,11 +19,27 @@ doc = docer("user")
 
 class UserResource(MethodResource):
     # @login_required
-    @marshal_with(UserSchema, code=200, description="A user")
-    @doc(description="Get the current logged in user", login_required=False, stub=False)
-    def get(self):
-        user = User.query.all()
-        return user[0]
+    @use_kwargs(UserPageArgsSchema, locations=("query",))
+    @marshal_with(UserPageSchema, code=200, description="A page of users")
+    @doc(
+        description=(
+            "List users ordered by id. Pass next_cursor as `after` to get the "
+            "following page"
+        ),
+        login_required=False,
+        stub=False,
+    )
+    def get(self, limit, after, with_total):
+        limit = min(limit, env.USER_PAGE_SIZE_MAX)
+        # One extra row tells if there is a next page
+        users = User.page(after=after, limit=limit + 1)
+        items = users[:limit]
+
+        return {
+            "items": items,
+            "next_cursor": items[-1].id if len(users) > limit else None,
+            "total_estimate": User.estimated_count() if with_total else None,
+        }
 
     @use_kwargs(UserSchema)
     @marshal_with(
@@ -58,3 +80,16 @@ class UserResource(MethodResource):
     @not_implemented
     def put(self, **kwargs):
         return "", 204
+
+
+class UserByIdResource(MethodResource):
+    @marshal_with(UserSchema, code=200, description="A user")
+    @marshal_with(None, code=404, description="No such user")
+    @doc(description="Get a user by id", login_required=False, stub=False)
+    def get(self, user_id):
+        user = User.get_by_id(user_id)
+
+        if user is None:
+            abort(404)
+
+        return user
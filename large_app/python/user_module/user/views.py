@@ -1,11 +1,17 @@
 from flask import Blueprint
 from user_module.models import docs
-from .user_resource import UserResource
+from .user_resource import UserByIdResource, UserResource
 
 
 blueprint = Blueprint("user", __name__)
 
 blueprint.add_url_rule("/user", view_func=UserResource.as_view("user"))
 docs.register(UserResource, endpoint="user", blueprint=blueprint.name)
+blueprint.add_url_rule(
+    "/user/<int:user_id>", view_func=UserByIdResource.as_view("user_by_id")
+)
+docs.register(
+    UserByIdResource, endpoint="user_by_id", blueprint=blueprint.name
+)
 
 __all__ = ["blueprint"]
\ No newline at end of file